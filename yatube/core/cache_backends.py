@@ -0,0 +1,309 @@
+"""Кеш в файле SQLite, общий для всех процессов на одном хосте.
+
+В отличие от LocMemCache, воркеры gunicorn видят одни и те же записи,
+поэтому попадания в кеш не делятся на число процессов, а сброс кеша
+сигналами доходит до всех воркеров. Файл работает в режиме WAL: чтения
+не блокируются записью. Размер кеша ограничен по байтам и по числу
+записей, при переполнении вытесняются давно не читавшиеся записи (LRU).
+
+Подключение:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_SIZE': 256 * 1024 * 1024},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats (id, entries, size) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries + 1, size = size + new.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries - 1, size = size - old.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size WHERE id = 1;
+END;
+'''
+
+# Как часто (в секундах) обновлять время последнего чтения записи:
+# без этого каждое чтение превращалось бы в запись в файл
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов кеш на SQLite в режиме WAL с LRU-вытеснением.
+
+    OPTIONS:
+        MAX_SIZE — предельный размер значений в байтах;
+        MAX_ENTRIES — предельное число записей (как у других бэкендов);
+        CULL_FREQUENCY — при переполнении удаляется 1/CULL_FREQUENCY
+            самых давно читавшихся записей;
+        BUSY_TIMEOUT — сколько секунд ждать блокировку записи.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 256 * 1024 * 1024))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # INSERT OR REPLACE удаляет старую строку: без этой настройки
+            # триггер удаления не сработает и счётчики размера разойдутся
+            connection.execute('PRAGMA recursive_triggers=ON')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _write(self):
+        return _WriteTransaction(self._connection())
+
+    @staticmethod
+    def _dump(value):
+        # Целые числа храним как INTEGER, чтобы incr() шёл одним UPDATE
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _size(value):
+        return 8 if isinstance(value, int) else len(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        # None — бессрочная запись
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        key_map = {self._key(key, version): key for key in keys}
+        now = time.time()
+        connection = self._connection()
+        result = {}
+        touched = []
+        expired = []
+        stored_keys = list(key_map)
+        # SQLite ограничивает число параметров запроса
+        for start in range(0, len(stored_keys), 500):
+            chunk = stored_keys[start:start + 500]
+            rows = connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                'WHERE key IN ({})'.format(', '.join('?' * len(chunk))),
+                chunk,
+            ).fetchall()
+            for stored_key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    expired.append(stored_key)
+                    continue
+                result[key_map[stored_key]] = self._load(value)
+                if now - accessed > ACCESS_RESOLUTION:
+                    touched.append(stored_key)
+        if touched or expired:
+            with self._write() as cursor:
+                cursor.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, stored_key) for stored_key in touched],
+                )
+                cursor.executemany(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    [(stored_key, now) for stored_key in expired],
+                )
+        return result
+
+    def _store(self, cursor, key, value, timeout, mode):
+        now = time.time()
+        value = self._dump(value)
+        cursor.execute(
+            f'INSERT OR {mode} INTO cache '
+            '(key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+            (key, value, self._expires(timeout), now, self._size(value)),
+        )
+        return cursor.rowcount > 0
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._write() as cursor:
+            for key, value in data.items():
+                self._store(
+                    cursor, self._key(key, version), value, timeout, 'REPLACE'
+                )
+            self._cull(cursor)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as cursor:
+            # Просроченная запись не мешает добавить новую
+            cursor.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = self._store(cursor, key, value, timeout, 'IGNORE')
+            if added:
+                self._cull(cursor)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as cursor:
+            cursor.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self._expires(timeout), now, key, now),
+            )
+            return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        with self._write() as cursor:
+            cursor.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                [(self._key(key, version),) for key in keys],
+            )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно увеличивает целое значение, даже между процессами."""
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as cursor:
+            cursor.execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, now, key, now),
+            )
+            if cursor.rowcount:
+                return cursor.execute(
+                    'SELECT value FROM cache WHERE key = ?', (key,)
+                ).fetchone()[0]
+            row = cursor.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        raise TypeError(f"Value of key '{key}' is not an integer")
+
+    def clear(self):
+        with self._write() as cursor:
+            cursor.execute('DELETE FROM cache')
+
+    def _cull(self, cursor):
+        """Удаляет просроченные, а при переполнении — давно не читавшиеся."""
+        entries, size = cursor.execute(
+            'SELECT entries, size FROM cache_stats WHERE id = 1'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        cursor.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        while True:
+            entries, size = cursor.execute(
+                'SELECT entries, size FROM cache_stats WHERE id = 1'
+            ).fetchone()
+            if entries <= self._max_entries and size <= self._max_size:
+                return
+            if not entries:
+                return
+            if self._cull_frequency == 0:
+                cursor.execute('DELETE FROM cache')
+                return
+            cursor.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(1, entries // self._cull_frequency),),
+            )
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами своего потока
+        pass
+
+
+class _WriteTransaction:
+    """BEGIN IMMEDIATE ... COMMIT: запись сразу берёт блокировку файла."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
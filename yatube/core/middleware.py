@@ -0,0 +1,21 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware, не пережимающий уже сжатые форматы.
+
+    Стоит первым в MIDDLEWARE, чтобы сжимать окончательный ответ.
+    Потоковые ответы (выгрузки, файлы) сжимаются потоком. Страницы из
+    кеша лент приходят уже сжатыми (posts.caching) и не пережимаются.
+    """
+    INCOMPRESSIBLE_TYPES = (
+        'image/', 'video/', 'audio/', 'font/woff', 'application/gzip',
+        'application/zip',
+    )
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (content_type.startswith(self.INCOMPRESSIBLE_TYPES)
+                and not content_type.startswith('image/svg')):
+            return response
+        return super().process_response(request, response)
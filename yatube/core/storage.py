@@ -0,0 +1,144 @@
+"""Хранилища файлов: медиа с адресацией по содержимому и статика."""
+import gzip
+import hashlib
+import io
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Расширения статики, которые имеет смысл сжимать заранее
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico',
+)
+
+# Блокировка имени файла: сколько секунд она живёт (на случай упавшего
+# процесса) и сколько ждать чужую
+LOCK_TIMEOUT = 60
+LOCK_WAIT = 10
+LOCK_RETRY_DELAY = 0.05
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """Сохраняет файл под именем из sha256 его содержимого.
+
+    Имя файла — <каталог>/<2 символа хеша>/<хеш><расширение>, поэтому
+    одинаковые загрузки ложатся в один файл на диске, а миниатюры sorl,
+    которые именуются по исходному файлу, тоже общие. Файл может быть
+    нужен нескольким записям: удалять его следует, только когда ссылок
+    на него не осталось (см. posts.thumbnails.release_image).
+
+    Повторная загрузка существующего файла обновляет его время изменения,
+    а сохранение и удаление идут под блокировкой имени (lock). Поэтому
+    очистка, проверяющая под той же блокировкой возраст файла (age) и
+    ссылки на него, не удалит файл, который только что загрузили для ещё
+    не сохранённого поста.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяет содержимое файла, а не исходное имя
+        return name
+
+    @contextmanager
+    def lock(self, name):
+        """Блокировка имени файла в общем кеше, одна на все процессы.
+
+        Отдаёт False, если блокировку не удалось взять за LOCK_WAIT.
+        """
+        key = f'media_lock:{name}'
+        deadline = time.monotonic() + LOCK_WAIT
+        while not cache.add(key, True, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                yield False
+                return
+            time.sleep(LOCK_RETRY_DELAY)
+        try:
+            yield True
+        finally:
+            cache.delete(key)
+
+    def age(self, name):
+        """Сколько секунд назад файл сохраняли или загружали повторно."""
+        return time.time() - os.path.getmtime(self.path(name))
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        with self.lock(name):
+            try:
+                # Такой файл уже есть: освежаем его, чтобы очистка
+                # не приняла его за давно забытый
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+            # Пишем во временный файл и атомарно переименовываем: при
+            # одновременной загрузке одного и того же файла в итоге
+            # на диске всё равно одна полная копия
+            temporary = super()._save(
+                f'{name}.{uuid.uuid4().hex}.tmp', content
+            )
+            os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешем содержимого в именах и готовыми .gz-копиями.
+
+    collectstatic записывает в STATIC_ROOT файлы вида app.<хеш>.css,
+    манифест соответствия имён и рядом с текстовыми файлами их сжатые
+    gzip-копии (если сжатие что-то даёт), которые отдаёт
+    core.views.static_file. Пока collectstatic не запускали и манифеста
+    нет, {% static %} отдаёт исходные имена, а не падает.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Файла нет ни в манифесте, ни в STATIC_ROOT
+            return name
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        buffer = io.BytesIO()
+        # mtime=0, чтобы сжатый файл не менялся от сборки к сборке
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                           mtime=0) as compressed:
+            compressed.write(content)
+        if buffer.tell() >= len(content):
+            return None
+        with open(f'{path}.gz', 'wb') as target:
+            target.write(buffer.getvalue())
+        return f'{name}.gz'
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            extension = os.path.splitext(name)[1].lower()
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                compressed = self._compress(name)
+                if compressed:
+                    yield name, compressed, True
@@ -0,0 +1,52 @@
+"""Фоновое выполнение коротких задач в пуле потоков процесса."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='yatube-task',
+            )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', func)
+    finally:
+        # Соединения с БД открываются в потоке пула и закрываются здесь же
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Ставит задачу в пул потоков, не блокируя текущий запрос.
+
+    При BACKGROUND_TASKS_EAGER задача выполняется сразу, в текущем потоке.
+    Ошибка задачи и тогда только пишется в лог, как в пуле: запрос,
+    поставивший задачу, от неё не падает. Тесты включают
+    BACKGROUND_TASKS_RAISE, чтобы ошибка задачи роняла тест.
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if settings.BACKGROUND_TASKS_RAISE:
+                raise
+            logger.exception('Фоновая задача %s завершилась ошибкой', func)
+            return None
+    return _get_executor().submit(_run, func, args, kwargs)
@@ -0,0 +1,206 @@
+import gzip
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .cache_backends import SQLiteCache
+from .storage import ContentHashStorage
+from .tasks import run_in_background
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+def fail():
+    raise ValueError('Ошибка задачи')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        """Значения сохраняются, читаются пачкой и удаляются."""
+        self.cache.set('text', 'Тестовый пост')
+        self.cache.set_many({'number': 10, 'list': [1, 2]})
+        self.assertEqual(self.cache.get('text'), 'Тестовый пост')
+        self.assertEqual(
+            self.cache.get_many(['number', 'list', 'missing']),
+            {'number': 10, 'list': [1, 2]},
+        )
+        self.cache.delete('text')
+        self.assertIsNone(self.cache.get('text'))
+        self.assertFalse(self.cache.add('number', 1))
+        self.assertTrue(self.cache.add('new', 1))
+
+    def test_expiration(self):
+        """Просроченные записи не возвращаются."""
+        self.cache.set('short', 'value', 0.05)
+        self.cache.set('forever', 'value', None)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'new'))
+        self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_shared_between_instances(self):
+        """Записи видны другому экземпляру бэкенда на том же файле."""
+        self.cache.set('shared', 'value')
+        other = SQLiteCache(self.location, {})
+        self.assertEqual(other.get('shared'), 'value')
+        other.delete('shared')
+        self.assertIsNone(self.cache.get('shared'))
+
+    def test_incr_is_atomic_between_processes(self):
+        """incr() не теряет обновления из разных процессов."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction_by_size(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_SIZE': 3000, 'CULL_FREQUENCY': 4},
+        })
+        cache.set('old', 'x' * 900)
+        cache.set('used', 'x' * 900)
+        time.sleep(1.1)
+        cache.get('used')
+        cache.set('new', 'x' * 900)
+        cache.set('newest', 'x' * 900)
+        self.assertIsNone(cache.get('old'))
+        self.assertIsNotNone(cache.get('used'))
+        self.assertIsNotNone(cache.get('newest'))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class BackgroundTasksTest(SimpleTestCase):
+    def test_eager_task_error_raised_in_tests(self):
+        """В тестах ошибка задачи, выполненной сразу, роняет тест."""
+        with self.assertRaises(ValueError):
+            run_in_background(fail)
+
+    @override_settings(BACKGROUND_TASKS_RAISE=False)
+    def test_eager_task_error_logged(self):
+        """Без BACKGROUND_TASKS_RAISE ошибка задачи только пишется в лог."""
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertIsNone(run_in_background(fail))
+
+
+class ContentHashStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentHashStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_same_content_stored_once(self):
+        """Одинаковое содержимое сохраняется в один файл."""
+        first = self.storage.save('posts/image.GIF', ContentFile(b'gif'))
+        second = self.storage.save('posts/other.gif', ContentFile(b'gif'))
+        third = self.storage.save('posts/image.gif', ContentFile(b'png'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertTrue(first.startswith('posts/'))
+        self.assertTrue(first.endswith('.gif'))
+        files = []
+        for root, dirs, names in os.walk(self.directory):
+            files += names
+        self.assertEqual(len(files), 2)
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(
+            settings.BASE_DIR, 'static', 'js', 'comments.js'
+        ), 'rb') as source:
+            self.source = source.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_hashed_precompressed_files(self):
+        """Файлы с хешем отдаются сжатыми заранее и кешируются надолго."""
+        with self.settings(STATIC_ROOT=self.directory):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('js/comments.js')
+            self.assertRegex(url, r'^/static/js/comments\.[0-9a-f]{12}\.js$')
+            response, content = self.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(content), self.source)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response, content = self.get(url)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(content, self.source)
+            response, content = self.get(url, HTTP_ACCEPT_ENCODING='xgzip')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(content, self.source)
+
+    def test_not_modified_keeps_cache_headers(self):
+        """Ответ 304 несёт те же Vary и Cache-Control, что и 200."""
+        with self.settings(STATIC_ROOT=self.directory):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('js/comments.js')
+            response, content = self.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            response = self.client.get(
+                url, HTTP_ACCEPT_ENCODING='gzip',
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_fallback_without_manifest(self):
+        """Без collectstatic статика отдаётся по исходным именам."""
+        with self.settings(STATIC_ROOT=self.directory):
+            url = static('js/comments.js')
+            self.assertEqual(url, '/static/js/comments.js')
+            response, content = self.get(url)
+            self.assertEqual(content, self.source)
+            self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_middleware_skips_compressed_formats(self):
+        """Картинки не пережимаются, текст без .gz сжимается потоком."""
+        with self.settings(STATIC_ROOT=self.directory):
+            response = self.client.get(
+                '/static/img/logo.png', HTTP_ACCEPT_ENCODING='gzip'
+            )
+            self.assertFalse(response.has_header('Content-Encoding'))
+            response, content = self.get(
+                '/static/js/comments.js', HTTP_ACCEPT_ENCODING='gzip'
+            )
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(content), self.source)
@@ -1,4 +1,20 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.middleware.gzip import re_accepts_gzip
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Имя с хешем содержимого от ManifestStaticFilesStorage: app.1a2b3c4d5e6f.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
 
 
 def page_not_found(request, exception):
@@ -17,3 +33,65 @@ def permission_denied(request, exception):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+def _find_static(path):
+    """Абсолютный путь файла статики или None.
+
+    Файл ищется в STATIC_ROOT, а если collectstatic ещё не запускали —
+    в исходных каталогах статики через finders.
+    """
+    try:
+        if settings.STATIC_ROOT:
+            full_path = safe_join(settings.STATIC_ROOT, path)
+            if os.path.isfile(full_path):
+                return full_path
+        return finders.find(path)
+    except SuspiciousFileOperation:
+        return None
+
+
+def _patch_static_headers(response, path):
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_NAME.search(path):
+        patch_cache_control(
+            response, public=True, max_age=settings.STATIC_MAX_AGE,
+            immutable=True,
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+
+
+def static_file(request, path):
+    # Заранее сжатая копия отдаётся без сжатия на лету, файлы с хешем
+    # в имени кешируются браузером навсегда
+    full_path = _find_static(path)
+    if not full_path:
+        raise Http404
+    content_type = mimetypes.guess_type(full_path)[0]
+    served_path = full_path
+    compressed = f'{full_path}.gz'
+    # Та же проверка, что в GZipMiddleware: целое слово gzip,
+    # а не подстрока
+    accepts_gzip = re_accepts_gzip.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    if accepts_gzip and os.path.isfile(compressed):
+        served_path = compressed
+    stat = os.stat(served_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        # 304 заменяет заголовки закешированного ответа: те же Vary
+        # и Cache-Control, иначе кеши потеряют их
+        response = HttpResponseNotModified()
+        _patch_static_headers(response, path)
+        return response
+    response = FileResponse(
+        open(served_path, 'rb'),
+        content_type=content_type or 'application/octet-stream',
+    )
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if served_path == compressed:
+        response['Content-Encoding'] = 'gzip'
+    _patch_static_headers(response, path)
+    return response
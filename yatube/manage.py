@@ -3,7 +3,12 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    # Тесты запускаются с собственными настройками (yatube.settings_test)
+    settings_module = (
+        'yatube.settings_test' if sys.argv[1:2] == ['test']
+        else 'yatube.settings'
+    )
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,22 +1,88 @@
+import hashlib
+
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 from .models import Post, Group, Comment, Follow
+from .search import FTS_TABLE, build_match
+from .utils import CachedCountPaginator, feed_count_key
+
+
+class CachedCountMixin:
+    """Количество строк списка в админке берётся из кеша.
+
+    Ключ строится по SQL выборки, поэтому у каждого сочетания фильтров
+    и поиска свой счётчик. Сигналы его не сбрасывают: устаревание
+    ограничено PAGINATOR_COUNT_TIMEOUT.
+    """
+    # Не считаем COUNT(*) всей таблицы на каждой странице
+    show_full_result_count = False
+    paginator = CachedCountPaginator
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        query = str(queryset.order_by().query)
+        count_key = feed_count_key(
+            f'admin:{self.model._meta.label_lower}',
+            hashlib.md5(query.encode()).hexdigest(),
+        )
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            count_key=count_key,
+        )
 
 
 # Регистрируем класс PostAdmin для модели Post через декоратор
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(CachedCountMixin, admin.ModelAdmin):
     # Перечисляем поля, которые должны отображаться в админке
     list_display = ('pk', 'text', 'created', 'author', 'group',)
-    list_editable = ('group',)
+    # Автора и группу достаём тем же запросом, что и посты
+    list_select_related = ('author', 'group')
+    # Вместо выпадающих списков со всеми пользователями и группами
+    raw_id_fields = ('author',)
+    autocomplete_fields = ('group',)
     # Добавляем интерфейс для поиска по тексту постов
     search_fields = ('text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('created',)
+    # Переход по датам идёт по индексу на created
+    date_hierarchy = 'created'
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт по индексу FTS5, а не LIKE '%...%'
+        match = build_match(search_term)
+        if match is None:
+            return queryset, False
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        ))
+        return queryset, False
 
-admin.site.register(Group)
 
-admin.site.register(Comment)
+@admin.register(Group)
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug', 'posts_count')
+    # Нужен для автодополнения группы в PostAdmin
+    search_fields = ('title', 'slug')
+    prepopulated_fields = {'slug': ('title',)}
+
+
+@admin.register(Comment)
+class CommentAdmin(CachedCountMixin, admin.ModelAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
+    list_filter = ('created',)
+    date_hierarchy = 'created'
+    empty_value_display = '-пусто-'
+
 
-admin.site.register(Follow)
+@admin.register(Follow)
+class FollowAdmin(CachedCountMixin, admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    # Точное совпадение имени ищется по уникальному индексу username
+    search_fields = ('=user__username', '=author__username')
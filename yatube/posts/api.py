@@ -0,0 +1,75 @@
+"""Read-only JSON API лент и постов для мобильного клиента.
+
+Те же данные, что и HTML-страницы index, group_posts, profile
+и post_detail, но без отрисовки шаблонов. Ленты листаются курсором
+(?after=, ?before=), ответы поддерживают ETag / Last-Modified:
+на совпавший условный запрос отдаётся 304 без сериализации.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from .caching import group_scope, index_scope, profile_scope
+from .conditional import feed_condition, post_condition
+from .models import Group, Post
+from .utils import CursorPaginator
+
+User = get_user_model()
+
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'created': post.created.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comments_count': post.comments_count,
+    }
+
+
+def _feed_response(request, posts):
+    paginator = CursorPaginator(
+        posts.select_related('author', 'group'), settings.COUNT_POSTS
+    )
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return JsonResponse(
+        {
+            'results': [serialize_post(post) for post in page_obj],
+            'next': page_obj.next_cursor,
+            'previous': page_obj.previous_cursor,
+        },
+        json_dumps_params=JSON_PARAMS,
+    )
+
+
+@feed_condition(index_scope, 'api')
+def index(request):
+    return _feed_response(request, Post.objects.all())
+
+
+@feed_condition(group_scope, 'api')
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _feed_response(request, group.posts.all())
+
+
+@feed_condition(profile_scope, 'api')
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return _feed_response(request, author.posts.all())
+
+
+@post_condition('api')
+def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
+    return JsonResponse(serialize_post(post), json_dumps_params=JSON_PARAMS)
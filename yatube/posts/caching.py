@@ -0,0 +1,166 @@
+"""Кеширование страниц лент со сбросом по событиям.
+
+Каждой ленте (главная, группа, профиль) соответствует «поколение» —
+случайная метка в кеше, которая входит в префикс ключа cache_page.
+Сигналы сохранения и удаления постов, комментариев, групп и подписок
+меняют поколение затронутых лент, и старые страницы просто перестают
+находиться. Поэтому TTL страниц можно держать большим.
+
+Поколение хранит и время своего создания: это дешёвый Last-Modified
+ленты для условных GET-запросов, без запросов к БД.
+
+Страницы кешируются уже сжатыми: для клиентов с gzip и без него
+хранятся разные копии, и попадание в кеш отдаётся без повторного сжатия
+(GZipMiddleware не трогает ответы с Content-Encoding).
+"""
+import datetime
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.text import compress_string
+from django.views.decorators.cache import cache_page
+
+
+def generation_key(scope):
+    return f'feed_generation:{scope}'
+
+
+# Общее поколение всех лент: меняется при правках групп и пользователей,
+# которые видны в карточках постов на любых страницах
+ALL_FEEDS = 'all'
+
+
+def _new_generation():
+    return f'{time.time():.6f}-{uuid.uuid4().hex}'
+
+
+def _get_generations(scope):
+    keys = [generation_key(scope), generation_key(ALL_FEEDS)]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generation = _new_generation()
+            # add(), чтобы параллельные запросы сошлись на одном значении
+            if not cache.add(key, generation, None):
+                generation = cache.get(key, generation)
+            generations[key] = generation
+    return [generations[key] for key in keys]
+
+
+def get_generation(scope):
+    """Метка поколения ленты вместе с общим поколением всех лент."""
+    return '{}.{}'.format(*_get_generations(scope))
+
+
+def get_generation_time(scope):
+    """Когда лента менялась последний раз или None."""
+    try:
+        timestamp = max(
+            float(generation.split('-')[0])
+            for generation in _get_generations(scope)
+        )
+    except ValueError:
+        # Метка в старом формате, без времени
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def _set_new_generations(scopes):
+    cache.set_many(
+        {generation_key(scope): _new_generation() for scope in scopes},
+        None,
+    )
+
+
+def bump_feeds(*scopes):
+    """Сбрасывает закешированные страницы перечисленных лент.
+
+    Поколение меняется сразу и ещё раз после фиксации транзакции:
+    запрос, пришедший между ними, видит старые данные и кеширует их под
+    промежуточным поколением, которое после фиксации уже не найдётся.
+    """
+    _set_new_generations(scopes)
+    transaction.on_commit(lambda: _set_new_generations(scopes))
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+def _accepted_encoding(request):
+    accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return 'gzip' if re_accepts_gzip.search(accept) else 'identity'
+
+
+def _compress(view_func):
+    """Сжимает ответ view до того, как cache_page положит его в кеш."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if (_accepted_encoding(request) != 'gzip'
+                or response.streaming
+                or response.has_header('Content-Encoding')
+                or response.status_code != 200):
+            return response
+        compressed = compress_string(response.content)
+        if len(compressed) < len(response.content):
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+            response['Content-Encoding'] = 'gzip'
+        return response
+    return wrapper
+
+
+def cache_feed(timeout, scope):
+    """Как cache_page, но с префиксом ключа из текущего поколения ленты.
+
+    scope — функция, строящая имя ленты из аргументов view,
+    например group_scope. Кодировка ответа тоже входит в префикс:
+    Vary: Accept-Encoding добавляется уже после кеша, иначе cache_page
+    хранил бы по копии на каждую строку Accept-Encoding браузеров.
+
+    Шапка и кнопки подписки у каждого пользователя свои, поэтому в префикс
+    входит и id пользователя: гости делят одну копию страницы,
+    у вошедшего пользователя копия своя.
+
+    Заголовки Expires и Cache-Control: max-age, которые ставит
+    cache_page, заменяются: лента сбрасывается на сервере по событиям,
+    а браузер об этом не узнает и час показывал бы старую страницу.
+    Клиент каждый раз переспрашивает сервер с If-None-Match.
+    """
+    def decorator(view_func):
+        compressed_view = _compress(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            feed = scope(**kwargs)
+            # Имя ленты с поколением длинные: хешируем, чтобы ключ
+            # не вырос за пределы, допустимые для memcached
+            key_prefix = 'feed:' + hashlib.md5(
+                f'{feed}:{get_generation(feed)}:{request.user.pk}:'
+                f'{_accepted_encoding(request)}'.encode()
+            ).hexdigest()
+            cached_view = cache_page(timeout, key_prefix=key_prefix)(
+                compressed_view
+            )
+            response = cached_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept-Encoding',))
+            patch_cache_control(response, max_age=0, private=True)
+            del response['Expires']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+"""Валидаторы ETag / Last-Modified для условных GET-запросов.
+
+Валидаторы считаются до выполнения view и без тяжёлых запросов:
+для лент — по поколению ленты в кеше (posts.caching), для поста —
+одним запросом по первичному ключу. Для HTML-страниц в ETag входит и id
+пользователя: шапка и кнопки у каждого свои. Если клиент прислал совпадающие
+If-None-Match или If-Modified-Since, view не вызывается вовсе
+и отдаётся 304.
+"""
+import hashlib
+
+from django.db.models import Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .caching import get_generation, get_generation_time, profile_scope
+from .models import Post
+
+
+def _etag(*parts):
+    # Слабый ETag: одна и та же страница отдаётся и сжатой, и без сжатия
+    raw = ':'.join(str(part) for part in parts)
+    return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def _viewer(request, per_user):
+    # В HTML есть шапка с именем пользователя и кнопки подписки,
+    # поэтому страница у каждого пользователя своя
+    return request.user.pk if per_user else None
+
+
+def feed_condition(scope, prefix, per_user=False):
+    """condition() для ленты: scope строит имя ленты из аргументов view.
+
+    В ETag входит строка запроса, ведь от курсора зависит страница.
+    """
+    def etag(request, **kwargs):
+        feed = scope(**kwargs)
+        return _etag(
+            prefix,
+            feed,
+            get_generation(feed),
+            request.GET.urlencode(),
+            _viewer(request, per_user),
+        )
+
+    def last_modified(request, **kwargs):
+        return get_generation_time(scope(**kwargs))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def get_post_state(request, post_id):
+    """Версия поста, время последнего комментария и лента автора.
+
+    Значение запоминается на время запроса: condition() вызывает
+    функции ETag и Last-Modified по отдельности.
+    """
+    states = request.__dict__.setdefault('_post_states', {})
+    if post_id not in states:
+        state = Post.objects.filter(pk=post_id).order_by().annotate(
+            last_comment=Max('comments__created')
+        ).values(
+            'updated', 'comments_count', 'last_comment', 'author__username'
+        ).first()
+        if state is not None:
+            # Поколение ленты автора меняется вместе с его счётчиками,
+            # именем и группами постов, которые видны на странице поста
+            state['feed'] = profile_scope(state['author__username'])
+        states[post_id] = state
+    return states[post_id]
+
+
+def _aware(value):
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def post_condition(prefix, per_user=False):
+    """condition() для страницы поста: правка поста и его комментарии."""
+    def etag(request, post_id):
+        state = get_post_state(request, post_id)
+        if state is None:
+            return None
+        return _etag(
+            prefix,
+            post_id,
+            state['updated'].timestamp(),
+            state['comments_count'],
+            state['last_comment'],
+            get_generation(state['feed']),
+            request.GET.urlencode(),
+            _viewer(request, per_user),
+        )
+
+    def last_modified(request, post_id):
+        state = get_post_state(request, post_id)
+        if state is None:
+            return None
+        candidates = [
+            _aware(state['updated']),
+            get_generation_time(state['feed']),
+        ]
+        if state['last_comment']:
+            candidates.append(_aware(state['last_comment']))
+        return max(filter(None, candidates))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
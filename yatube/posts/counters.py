@@ -0,0 +1,144 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарным UPDATE ... SET field = field + 1 в той же
+транзакции, что и изменение самих данных. Расхождения, накопленные
+в обход сигналов (bulk-операции, правки в БД), исправляет команда
+reconcile_counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        # Не уводим счётчик в минус, если он уже разошёлся с данными
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def _count_subquery(model, field, outer='pk'):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef(outer)})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def recount_author_stats(user_id):
+    counts = {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+    try:
+        with transaction.atomic():
+            stats, created = AuthorStats.objects.update_or_create(
+                user_id=user_id, defaults=counts
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        stats = AuthorStats.objects.get(user_id=user_id)
+    return stats
+
+
+def get_author_stats(user):
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return recount_author_stats(user.pk)
+
+
+def change_author_stats(user_id, field, delta):
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    updated = _change(stats, field, delta)
+    if not updated and delta > 0:
+        # Строки счётчиков ещё нет: создаём её сразу с точными значениями
+        recount_author_stats(user_id)
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post_comments(post_id, delta):
+    if post_id is not None:
+        _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _reconcile_batches(queryset, fields, batch_size):
+    """Сверяет счётчики пачками по первичному ключу.
+
+    Для каждой пачки выполняется один SELECT с подзапросами-пересчётами
+    и один bulk_update только для разошедшихся строк.
+    """
+    model = queryset.model
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        changed = []
+        for obj in batch:
+            stale = False
+            for field in fields:
+                real = getattr(obj, f'real_{field}')
+                if getattr(obj, field) != real:
+                    setattr(obj, field, real)
+                    stale = True
+            if stale:
+                changed.append(obj)
+        if changed:
+            with transaction.atomic():
+                model.objects.bulk_update(changed, fields)
+        yield len(batch), len(changed)
+
+
+def reconcile_groups(batch_size):
+    return _reconcile_batches(
+        Group.objects.annotate(
+            real_posts_count=_count_subquery(Post, 'group')
+        ),
+        ['posts_count'],
+        batch_size,
+    )
+
+
+def reconcile_posts(batch_size):
+    return _reconcile_batches(
+        Post.objects.only('pk', 'comments_count').annotate(
+            real_comments_count=_count_subquery(Comment, 'post')
+        ),
+        ['comments_count'],
+        batch_size,
+    )
+
+
+def reconcile_authors(batch_size):
+    """Создаёт недостающие строки AuthorStats и сверяет существующие."""
+    missing = list(
+        User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+    )
+    for user_id in missing:
+        recount_author_stats(user_id)
+    return _reconcile_batches(
+        AuthorStats.objects.annotate(
+            real_posts_count=_count_subquery(Post, 'author', 'user'),
+            real_followers_count=_count_subquery(Follow, 'author', 'user'),
+            real_following_count=_count_subquery(Follow, 'user', 'user'),
+        ),
+        ['posts_count', 'followers_count', 'following_count'],
+        batch_size,
+    )
@@ -12,3 +12,15 @@ class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class ExportForm(forms.Form):
+    """Фильтры выгрузки постов и комментариев (posts.export)."""
+    format = forms.ChoiceField(
+        choices=(('ndjson', 'NDJSON'), ('csv', 'CSV')),
+        required=False,
+    )
+    since = forms.DateField(required=False, label='С даты')
+    until = forms.DateField(required=False, label='По дату включительно')
+    author = forms.CharField(required=False, label='Имя автора')
+    group = forms.SlugField(required=False, label='Идентификатор группы')
@@ -0,0 +1,88 @@
+"""Кеш отрисованных карточек постов (posts/includes/posts.html).
+
+Ключ карточки содержит дату изменения поста и версии его автора,
+группы и картинки, поэтому устаревшая карточка просто перестаёт
+находиться в кеше: пост меняет ключ сам при сохранении, версии автора
+и группы поднимают обработчики сигналов, а версию картинки — нарезка
+миниатюр. Все карточки страницы и версии читаются из кеша двумя
+запросами get_many.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .thumbnails import image_version_key, prefetch_thumbnails
+
+CARD_TEMPLATE = 'posts/includes/posts.html'
+
+
+def version_key(kind, pk):
+    return f'card_version:{kind}:{pk}'
+
+
+def _set_new_version(kind, pk):
+    cache.set(version_key(kind, pk), uuid.uuid4().hex, None)
+
+
+def bump_version(kind, pk):
+    """Делает недействительными карточки постов автора или группы.
+
+    Как и bump_feeds, сразу и ещё раз после фиксации транзакции.
+    """
+    _set_new_version(kind, pk)
+    transaction.on_commit(lambda: _set_new_version(kind, pk))
+
+
+def _get_versions(posts):
+    keys = set()
+    for post in posts:
+        keys.add(version_key('user', post.author_id))
+        if post.group_id:
+            keys.add(version_key('group', post.group_id))
+        if post.image:
+            keys.add(image_version_key(post.image.name))
+    versions = cache.get_many(keys)
+    # Пропавшая из кеша версия получает новое случайное значение,
+    # чтобы не совпасть со старыми ключами карточек
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def card_key(post, versions, show_group):
+    return 'post_card:{}:{}:{}:{}:{}:{}:{}'.format(
+        post.pk,
+        post.updated.timestamp(),
+        versions[version_key('user', post.author_id)],
+        post.group_id,
+        versions.get(version_key('group', post.group_id), ''),
+        versions.get(image_version_key(post.image.name), ''),
+        int(bool(show_group)),
+    )
+
+
+def render_post_cards(posts, show_group=False):
+    """Возвращает HTML карточек постов, отрисовывая только недостающие."""
+    versions = _get_versions(posts)
+    keys = [card_key(post, versions, show_group) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [
+        (post, key) for post, key in zip(posts, keys) if key not in cards
+    ]
+    # Миниатюры всех недостающих карточек ищутся одним запросом
+    prefetch_thumbnails([post for post, key in missing])
+    rendered = {}
+    for post, key in missing:
+        rendered[key] = render_to_string(
+            CARD_TEMPLATE, {'post': post, 'show_group': show_group}
+        )
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,229 @@
+"""Пошаговая сборка мусора в медиафайлах.
+
+Мусор бывает двух видов:
+    * записи KVStore sorl о картинках, на которые не ссылается ни один
+      пост, вместе с их миниатюрами;
+    * файлы в media/posts и media/cache, о которых не знают ни посты,
+      ни KVStore.
+
+Сборка идёт пачками: сначала по записям KVStore в порядке ключей, затем
+по файлам в порядке путей. Обход каталога ленивый и отсортированный,
+поэтому в памяти одна пачка, а не всё дерево. После каждой пачки позиция
+записывается в файл контрольной точки, и прерванная сборка продолжается
+с того же места. Свежие файлы не трогаются: их пост может быть ещё
+не сохранён.
+"""
+import json
+import os
+import time
+from itertools import islice
+
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+
+PHASES = ('kvstore', 'files')
+
+
+def _image_dir():
+    return Post._meta.get_field('image').upload_to.strip('/')
+
+
+def _thumbnail_dir():
+    return thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+
+
+def walk_files(root, tops, after=None):
+    """Пути файлов (от root) в каталогах tops по порядку, после after.
+
+    Каталоги читаются по одному и сортируются, поэтому порядок путей
+    один и тот же между запусками, а поддеревья до after пропускаются
+    целиком, не читаясь.
+    """
+    after_parts = after.split('/') if after else None
+
+    def walk(relative):
+        try:
+            entries = sorted(
+                os.scandir(os.path.join(root, relative)),
+                key=lambda entry: entry.name,
+            )
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            name = f'{relative}/{entry.name}' if relative else entry.name
+            parts = name.split('/')
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if after_parts and (
+                parts < after_parts[:len(parts)] if is_dir
+                else parts <= after_parts
+            ):
+                continue
+            if is_dir:
+                yield from walk(name)
+            else:
+                yield name, entry.stat(follow_symlinks=False)
+
+    for top in sorted(tops):
+        yield from walk(top)
+
+
+class GarbageCollector:
+    """Сборщик мусора с контрольной точкой в файле checkpoint."""
+
+    def __init__(self, checkpoint, batch_size=500, min_age=60 * 60,
+                 dry_run=False):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.checkpoint, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {'phase': PHASES[0], 'after': None,
+                    'deleted': 0, 'freed': 0}
+
+    def _save_state(self):
+        if self.dry_run:
+            return
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.checkpoint)
+
+    def reset(self):
+        self.state = {'phase': PHASES[0], 'after': None,
+                      'deleted': 0, 'freed': 0}
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def _referenced_images(self, names):
+        return set(
+            Post.objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+
+    def _delete_file(self, storage, name):
+        try:
+            size = storage.size(name)
+            if not self.dry_run:
+                storage.delete(name)
+        except OSError:
+            return
+        self.state['deleted'] += 1
+        self.state['freed'] += size
+
+    def _delete_image(self, storage, name):
+        # Перепроверка под блокировкой имени: файл могли только что
+        # загрузить повторно для нового поста
+        with storage.lock(name) as locked:
+            try:
+                fresh = storage.age(name) < self.min_age
+            except OSError:
+                return
+            if locked and not fresh and not self._referenced_images([name]):
+                self._delete_file(storage, name)
+
+    def _kvstore_batch(self):
+        """Чистит записи KVStore о картинках, которых нет в постах."""
+        prefix = add_prefix('', 'image')
+        rows = KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).order_by('key')
+        if self.state['after']:
+            rows = rows.filter(key__gt=self.state['after'])
+        rows = list(rows.values_list('key', 'value')[:self.batch_size])
+        if not rows:
+            return False
+        sources = []
+        for key, value in rows:
+            image = deserialize_image_file(value)
+            # Записи самих миниатюр удаляются вместе с их картинкой
+            if not image.name.startswith(_thumbnail_dir() + '/'):
+                sources.append(image)
+        referenced = self._referenced_images([i.name for i in sources])
+        for image in sources:
+            if image.name in referenced:
+                continue
+            thumbnails = default.kvstore._get(
+                image.key, identity='thumbnails'
+            ) or []
+            for thumbnail_key in thumbnails:
+                thumbnail = default.kvstore._get(thumbnail_key)
+                if thumbnail:
+                    self._delete_file(thumbnail.storage, thumbnail.name)
+            if not self.dry_run:
+                default.kvstore.delete(image)
+        self.state['after'] = rows[-1][0]
+        return True
+
+    def _files_batch(self):
+        """Удаляет файлы картинок и миниатюр, на которые нет ссылок."""
+        storage = default.storage
+        files = list(islice(
+            walk_files(
+                storage.location, (_image_dir(), _thumbnail_dir()),
+                self.state['after'],
+            ),
+            self.batch_size,
+        ))
+        if not files:
+            return False
+        deadline = time.time() - self.min_age
+        old = [name for name, stat in files if stat.st_mtime < deadline]
+        images = {
+            name for name in old if name.startswith(_image_dir() + '/')
+        }
+        referenced = self._referenced_images(images)
+        thumbnail_keys = {
+            add_prefix(ImageFile(name, storage).key): name
+            for name in old if name.startswith(_thumbnail_dir() + '/')
+        }
+        known = set(
+            KVStoreModel.objects.filter(key__in=thumbnail_keys)
+            .values_list('key', flat=True)
+        )
+        image_storage = Post._meta.get_field('image').storage
+        for name in sorted(images - referenced):
+            self._delete_image(image_storage, name)
+        for key, name in thumbnail_keys.items():
+            if key not in known:
+                self._delete_file(storage, name)
+        self.state['after'] = files[-1][0]
+        return True
+
+    def run(self, max_batches=None, pause=0):
+        """Обрабатывает пачки и после каждой отдаёт текущее состояние.
+
+        Останавливается после max_batches пачек или когда мусор кончился;
+        в последнем случае контрольная точка удаляется.
+        """
+        batches = 0
+        while self.state['phase'] is not None:
+            if max_batches and batches >= max_batches:
+                return
+            if batches and pause:
+                time.sleep(pause)
+            step = (
+                self._kvstore_batch if self.state['phase'] == 'kvstore'
+                else self._files_batch
+            )
+            if not step():
+                index = PHASES.index(self.state['phase']) + 1
+                self.state['phase'] = (
+                    PHASES[index] if index < len(PHASES) else None
+                )
+                self.state['after'] = None
+            batches += 1
+            self._save_state()
+            yield self.state
+        if not self.dry_run and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
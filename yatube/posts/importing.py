@@ -0,0 +1,147 @@
+"""Потоковый импорт постов из JSONL.
+
+Каждая строка файла — JSON-объект вида
+{"title": ..., "body": ..., "userId": ..., "group": ...}: userId — id
+или username автора, group — необязательный slug группы. Файл читается
+построчно, посты вставляются пачками через bulk_create, поэтому память
+не зависит от размера файла.
+
+bulk_create не вызывает сигналы, поэтому счётчики, кеши лент и ленты
+подписок обновляются здесь же, один раз на пачку. Индекс поиска
+поддерживают триггеры БД.
+"""
+import json
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from . import counters, timelines
+from .caching import ALL_FEEDS, bump_feeds
+from .models import Group, Post
+from .utils import feed_count_key
+
+User = get_user_model()
+
+
+class RowError(Exception):
+    """Строку файла нельзя превратить в пост."""
+
+
+def _parse(line):
+    """Возвращает (автор, slug группы, текст) из строки JSONL."""
+    try:
+        row = json.loads(line)
+    except ValueError as error:
+        raise RowError(f'некорректный JSON: {error}')
+    if not isinstance(row, dict):
+        raise RowError('строка должна быть JSON-объектом')
+    author = row.get('userId')
+    if isinstance(author, bool) or not isinstance(author, (int, str)):
+        raise RowError('userId должен быть id или username автора')
+    group = row.get('group') or None
+    if group is not None and not isinstance(group, str):
+        raise RowError('group должен быть slug группы')
+    title = str(row.get('title') or '').strip()
+    body = str(row.get('body') or '').strip()
+    text = '\n\n'.join(part for part in (title, body) if part)
+    if not text:
+        raise RowError('пустые title и body')
+    return str(author), group, text
+
+
+def _resolve_authors(refs):
+    """{userId из файла: pk автора} для пачки — двумя запросами."""
+    ids = {int(ref) for ref in refs if ref.isdigit()}
+    usernames = {ref for ref in refs if not ref.isdigit()}
+    authors = {}
+    if ids:
+        authors.update(
+            (str(pk), pk) for pk in
+            User.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+    if usernames:
+        authors.update(
+            User.objects.filter(username__in=usernames)
+            .values_list('username', 'pk')
+        )
+    return authors
+
+
+def _parse_lines(lines, errors):
+    rows = []
+    for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            rows.append((number, *_parse(line)))
+        except RowError as error:
+            errors.append((number, str(error)))
+    return rows
+
+
+def _build_posts(rows, errors):
+    authors = _resolve_authors({author for _, author, _, _ in rows})
+    slugs = {slug for _, _, slug, _ in rows if slug}
+    groups = dict(
+        Group.objects.filter(slug__in=slugs).values_list('slug', 'pk')
+    ) if slugs else {}
+    posts = []
+    for number, author, slug, text in rows:
+        if author not in authors:
+            errors.append((number, f'автор {author} не найден'))
+        elif slug and slug not in groups:
+            errors.append((number, f'группа {slug} не найдена'))
+        else:
+            posts.append(Post(
+                author_id=authors[author],
+                group_id=groups.get(slug),
+                text=text,
+            ))
+    return posts
+
+
+def _save_posts(posts):
+    """Вставляет пачку постов и обновляет то, что обновили бы сигналы."""
+    per_author = Counter(post.author_id for post in posts)
+    per_group = Counter(post.group_id for post in posts if post.group_id)
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        for author_id, count in per_author.items():
+            counters.change_author_stats(author_id, 'posts_count', count)
+        for group_id, count in per_group.items():
+            counters.change_group_posts(group_id, count)
+    cache.delete(feed_count_key('index'))
+    timelines.drop_followers_timelines(list(per_author))
+
+
+def _import_batch(lines, errors):
+    posts = _build_posts(_parse_lines(lines, errors), errors)
+    if posts:
+        _save_posts(posts)
+    return len(posts)
+
+
+def import_posts(lines, batch_size):
+    """Импортирует посты из итератора строк JSONL.
+
+    Генератор: после каждой пачки отдаёт (прочитано строк, создано
+    постов, ошибки пачки), где ошибки — список (номер строки, текст).
+    """
+    numbered = enumerate(lines, start=1)
+    imported = 0
+    try:
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                return
+            errors = []
+            created = _import_batch(batch, errors)
+            imported += created
+            yield len(batch), created, errors
+    finally:
+        if imported:
+            # Новые посты есть на главной и в профилях авторов
+            bump_feeds(ALL_FEEDS)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.query_plans import explain, feed_queries, plan_problems
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN QUERY PLAN, что запросы лент идут по '
+        'индексам в нужном порядке, а не полным проходом по таблице '
+        'с сортировкой.'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда разбирает планы только SQLite')
+        failed = []
+        for name, (sql, params), allow_sort in feed_queries():
+            plan = explain(sql, params)
+            problems = plan_problems(plan, allow_sort)
+            if problems:
+                failed.append(name)
+            if problems or options['verbosity'] > 1:
+                self.stdout.write(f'{name}:')
+                for step in plan:
+                    self.stdout.write(f'    {step}')
+        if failed:
+            raise CommandError(
+                'Запросы без подходящего индекса: ' + ', '.join(failed)
+            )
+        self.stdout.write('Все запросы лент идут по индексам')
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.garbage import GarbageCollector
+
+
+class Command(BaseCommand):
+    help = (
+        'Пошагово удаляет картинки и миниатюры, на которые не ссылаются '
+        'посты, и лишние записи KVStore. Прерванная сборка продолжается '
+        'с контрольной точки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов или записей проверять за пачку.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.5,
+            help='Пауза между пачками в секундах.',
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=0,
+            help='Остановиться после стольких пачек (0 — до конца).',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.MEDIA_GC_CHECKPOINT,
+            help='Файл контрольной точки.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не глядя на контрольную точку.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать мусор, ничего не удаляя.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        collector = GarbageCollector(
+            options['checkpoint'],
+            batch_size=options['batch_size'],
+            min_age=options['min_age'],
+            dry_run=options['dry_run'],
+        )
+        if options['restart']:
+            collector.reset()
+        state = collector.state
+        for state in collector.run(options['max_batches'], options['pause']):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{state["phase"]}: {state["after"]}, '
+                    f'удалено {state["deleted"]}'
+                )
+        finished = state['phase'] is None
+        verb = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {state["deleted"]}, '
+            f'{state["freed"] / 1024 / 1024:.1f} МБ'
+            + ('' if finished else '; продолжение со следующего запуска')
+        )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.caching import ALL_FEEDS, bump_feeds
+from posts.models import Post
+from posts.thumbnails import release_image, schedule_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище с адресацией по содержимому: '
+        'одинаковые файлы сливаются в один, копии удаляются.'
+    )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = (
+            Post.objects.exclude(image='').order_by('image')
+            .values_list('image', flat=True).distinct()
+        )
+        moved = merged = freed = 0
+        # Список имён читается целиком: ниже эти же строки обновляются
+        for name in list(names):
+            if not storage.exists(name):
+                self.stderr.write(f'Нет файла: {name}')
+                continue
+            with storage.open(name) as content:
+                new_name = storage.hashed_name(name, content)
+                if new_name == name:
+                    continue
+                existed = storage.exists(new_name)
+                size = storage.size(name)
+                storage.save(name, content)
+            with transaction.atomic():
+                # updated меняется, чтобы сбросились закешированные карточки
+                Post.objects.filter(image=name).update(
+                    image=new_name, updated=timezone.now()
+                )
+                release_image(name)
+                schedule_thumbnails(new_name)
+            moved += 1
+            if existed:
+                merged += 1
+                freed += size
+        bump_feeds(ALL_FEEDS)
+        self.stdout.write(
+            f'Перенесено файлов: {moved}, из них дубликатов: {merged}; '
+            f'освобождено {freed / 1024 / 1024:.1f} МБ'
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import EXPORTS, export_lines
+from posts.forms import ExportForm
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты или комментарии в NDJSON или CSV потоком, '
+        'не загружая таблицу в память целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'), default='ndjson'
+        )
+        parser.add_argument('--since', help='С даты (ГГГГ-ММ-ДД).')
+        parser.add_argument(
+            '--until', help='По дату включительно (ГГГГ-ММ-ДД).'
+        )
+        parser.add_argument('--author', help='Имя автора.')
+        parser.add_argument('--group', help='Идентификатор группы.')
+        parser.add_argument(
+            '--output', help='Файл для выгрузки; по умолчанию stdout.'
+        )
+
+    def handle(self, *args, **options):
+        form = ExportForm({
+            field: options[field]
+            for field in ('format', 'since', 'until', 'author', 'group')
+            if options[field] is not None
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        filters = form.cleaned_data
+        export_format = filters.pop('format')
+        lines = export_lines(options['kind'], export_format, **filters)
+        if options['output']:
+            output = open(options['output'], 'w', encoding='utf-8',
+                          newline='')
+        else:
+            output = self.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if output is not self.stdout:
+                output.close()
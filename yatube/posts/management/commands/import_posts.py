@@ -0,0 +1,58 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importing import import_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты из JSONL-файла (title, body, userId и '
+        'необязательный group), вставляя их пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу JSONL или «-» для чтения из stdin.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк вставлять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        path = options['path']
+        try:
+            source = (
+                sys.stdin if path == '-'
+                else open(path, encoding='utf-8')
+            )
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+        started = time.monotonic()
+        total = imported = failed = 0
+        try:
+            batches = import_posts(source, options['batch_size'])
+            for read, created, errors in batches:
+                total += read
+                imported += created
+                failed += len(errors)
+                for number, message in errors:
+                    self.stderr.write(f'Строка {number}: {message}')
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Прочитано строк: {total}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            f'Импортировано постов: {imported}, ошибок: {failed}; '
+            f'{total} строк за {elapsed:.1f} с ({rate:.0f} строк/с)'
+        )
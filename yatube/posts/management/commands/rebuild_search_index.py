@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает полнотекстовый индекс постов (FTS5) '
+        'и восстанавливает триггеры, которые его поддерживают.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        search.rebuild_index()
+        self.stdout.write(
+            f'Индекс поиска пересобран за '
+            f'{time.monotonic() - started:.1f} с'
+        )
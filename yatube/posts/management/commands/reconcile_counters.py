@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики постов, комментариев '
+        'и подписок и исправляет разошедшиеся значения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк сверять за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        targets = (
+            ('группы', counters.reconcile_groups),
+            ('посты', counters.reconcile_posts),
+            ('пользователи', counters.reconcile_authors),
+        )
+        for title, reconcile in targets:
+            checked = fixed = 0
+            for batch_checked, batch_fixed in reconcile(batch_size):
+                checked += batch_checked
+                fixed += batch_fixed
+            self.stdout.write(
+                f'{title}: проверено {checked}, исправлено {fixed}'
+            )
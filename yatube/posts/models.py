@@ -1,15 +1,44 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
+from core.storage import ContentHashStorage
 
 
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersMixin:
+    """Не перезаписывает счётчики при сохранении существующей записи.
+
+    Счётчики меняются только атомарными UPDATE из posts.counters,
+    а значение в памяти объекта могло устареть с момента его загрузки.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersMixin, models.Model):
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     slug = models.SlugField(unique=True, verbose_name='Идентификатор')
     description = models.TextField(verbose_name='Описание')
+    # Денормализованный счётчик, поддерживается сигналами (posts.counters)
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество постов'
+    )
+
+    counter_fields = ('posts_count',)
 
     class Meta:
         verbose_name_plural = 'Группы'
@@ -18,7 +47,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(CreatedModel):
+class Post(CountersMixin, CreatedModel):
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Текст нового поста'
@@ -39,15 +68,45 @@ class Post(CreatedModel):
         help_text='Группа, к которой будет относиться пост'
     )
 
+    # Файлы адресуются по содержимому; по картинке ищутся посты,
+    # которые на неё ссылаются (posts.thumbnails.release_image)
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentHashStorage(),
+        blank=True,
+        db_index=True
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев'
+    )
+    # Меняется при каждом сохранении: служит версией поста для кешей
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
     )
 
+    counter_fields = ('comments_count',)
+
     # Сделаем сортировку в meta классе по дате
     class Meta:
         ordering = ['-created']
+        # Индексы под сортировку лент: главная и переход по датам
+        # в админке, лента группы, профиль и сборка ленты подписок.
+        # Запросы лент сверяет с ними команда check_query_plans
+        indexes = [
+            models.Index(fields=['created', 'id'], name='post_created_idx'),
+            models.Index(
+                fields=['group', 'created', 'id'],
+                name='post_group_created_idx',
+            ),
+            models.Index(
+                fields=['author', 'created', 'id'],
+                name='post_author_created_idx',
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -77,6 +136,16 @@ class Comment(CreatedModel):
         help_text='Введите комментарий'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'], name='comment_created_idx'),
+            # Комментарии поста и последние комментарии под карточками
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -94,5 +163,38 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+        # Подписчики автора: раскладка постов по лентам подписок
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
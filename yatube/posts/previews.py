@@ -0,0 +1,49 @@
+"""Последние комментарии под карточками постов в лентах.
+
+Для всей страницы ленты комментарии выбираются одним запросом:
+оконная функция ROW_NUMBER() нумерует комментарии каждого поста
+от новых к старым, и остаются первые FEED_COMMENT_PREVIEWS. Количество
+комментариев берётся из денормализованного Post.comments_count,
+который приходит вместе с постами.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Comment
+
+LATEST_COMMENTS_SQL = '''
+    SELECT comment.id, comment.post_id, comment.author_id, comment.text,
+           comment.created, author.username AS author_username
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY post_id ORDER BY created DESC, id DESC
+        ) AS position
+        FROM posts_comment
+        WHERE post_id IN ({})
+    ) AS comment
+    INNER JOIN auth_user AS author ON author.id = comment.author_id
+    WHERE comment.position <= %s
+    ORDER BY comment.created, comment.id
+'''
+
+
+def attach_latest_comments(posts):
+    """Кладёт в post.latest_comments последние комментарии поста.
+
+    Комментарии идут от старых к новым, имя автора приходит тем же
+    запросом в comment.author_username. Посты без комментариев в запрос
+    не попадают.
+    """
+    limit = settings.FEED_COMMENT_PREVIEWS
+    post_ids = [post.pk for post in posts if post.comments_count]
+    latest = defaultdict(list)
+    if post_ids and limit:
+        comments = Comment.objects.raw(
+            LATEST_COMMENTS_SQL.format(', '.join(['%s'] * len(post_ids))),
+            [*post_ids, limit],
+        )
+        for comment in comments:
+            latest[comment.post_id].append(comment)
+    for post in posts:
+        post.latest_comments = latest[post.pk]
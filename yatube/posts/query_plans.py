@@ -0,0 +1,112 @@
+"""Проверка планов запросов лент через EXPLAIN QUERY PLAN (SQLite).
+
+feed_queries() повторяет запросы, которыми view выбирают страницы лент,
+комментарии и подписчиков. План каждого запроса проверяется на самый
+дорогой случай: полный проход по таблице и сортировку во временном
+B-дереве. Так запрос читает всю таблицу, чтобы отдать одну страницу.
+Страницы лент к тому же должны идти по индексу в нужном порядке, без
+сортировки вовсе: иначе сортируются все посты группы или автора.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Comment, Follow, Post
+from .previews import LATEST_COMMENTS_SQL
+
+# Значения параметров не влияют на план, важна только форма запроса
+SAMPLE_ID = 1
+SAMPLE_DATE = datetime.datetime(2022, 1, 1)
+
+
+def _cursor_page(queryset, ordering):
+    """Страница после курсора, как в CursorPaginator."""
+    lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+    return queryset.order_by(*ordering).filter(
+        Q(**{f'created__{lookup}': SAMPLE_DATE})
+        | Q(created=SAMPLE_DATE, **{f'pk__{lookup}': SAMPLE_ID})
+    )[:settings.COUNT_POSTS + 1]
+
+
+def _feed(queryset):
+    """Первая страница ленты и страница после курсора."""
+    return [
+        ('страница', queryset[:settings.COUNT_POSTS]),
+        ('курсор', _cursor_page(queryset, ('-created', '-pk'))),
+    ]
+
+
+def feed_queries():
+    """Тройки (имя, (sql, params), можно ли сортировать) запросов.
+
+    Сортировка разрешена там, где она неизбежна и ограничена: при сборке
+    ленты подписок сливаются посты разных авторов, а последние
+    комментарии выбираются для десятка постов страницы.
+    """
+    posts = Post.objects.select_related('author', 'group')
+    querysets = {
+        'index': _feed(posts),
+        'group_posts': _feed(posts.filter(group_id=SAMPLE_ID)),
+        'profile': _feed(posts.filter(author_id=SAMPLE_ID)),
+        'follow_index': [
+            ('сборка ленты', Post.objects.filter(
+                author__following__user_id=SAMPLE_ID
+            ).order_by('-created', '-pk').values_list(
+                'created', 'pk', 'author_id'
+            )[:settings.TIMELINE_LENGTH]),
+            ('подписчики автора', Follow.objects.filter(
+                author_id=SAMPLE_ID
+            ).values_list('user_id', flat=True)),
+        ],
+        'post_detail': [
+            ('комментарии', _cursor_page(
+                Comment.objects.filter(post_id=SAMPLE_ID)
+                .select_related('author'),
+                ('created', 'pk'),
+            )),
+        ],
+    }
+    sorted_queries = {'follow_index: сборка ленты'}
+    queries = []
+    for view, items in querysets.items():
+        for name, queryset in items:
+            name = f'{view}: {name}'
+            queries.append((
+                name, queryset.query.sql_with_params(),
+                name in sorted_queries,
+            ))
+    ids = [SAMPLE_ID] * settings.COUNT_POSTS
+    queries.append((
+        'ленты: последние комментарии',
+        (LATEST_COMMENTS_SQL.format(', '.join(['%s'] * len(ids))),
+         [*ids, settings.FEED_COMMENT_PREVIEWS]),
+        True,
+    ))
+    return queries
+
+
+def explain(sql, params):
+    """Строки плана запроса: детали из EXPLAIN QUERY PLAN."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan, allow_sort=False):
+    """Шаги плана с полным проходом по таблице вместе с сортировкой,
+    а если сортировка не разрешена — и с любой сортировкой.
+
+    Проход по подзапросу или материализованному CTE таблицей не считается.
+    """
+    tables = set(connection.introspection.table_names())
+    full_scans = [
+        step for step in plan
+        if step.startswith('SCAN ') and ' INDEX ' not in step
+        and step.split()[1] in tables
+    ]
+    sorts = [step for step in plan if 'TEMP B-TREE' in step]
+    if full_scans and sorts:
+        return full_scans + sorts
+    return [] if allow_sort else sorts
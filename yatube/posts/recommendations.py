@@ -0,0 +1,310 @@
+"""Рекомендации «Кого почитать» по графу подписок.
+
+Граф подписок целиком держится в памяти процесса в виде двух
+CSR-матриц смежности на массивах NumPy: «на кого подписан» и «кто
+подписан». Строка пользователя — срез indices[indptr[u]:indptr[u + 1]],
+поэтому соседи достаются без запросов к БД и без словарей Python.
+
+Кандидаты оцениваются двумя сигналами:
+    * друзья друзей — авторы, на которых подписаны мои авторы;
+    * совместные подписки — на кого ещё подписаны читатели моих авторов.
+
+Граф строится из posts_follow одним проходом. Подписки и отписки в этом
+процессе применяются к нему сразу (обработчики сигналов Follow) как
+поправки поверх массивов, проиндексированные в обе стороны; граф целиком
+перестраивается раз в FOLLOW_GRAPH_TIMEOUT секунд или когда поправок
+накопилось больше FOLLOW_GRAPH_MAX_CHANGES — так подтягиваются
+и изменения из других процессов.
+
+Построение графа на миллионах подписок занимает секунды, поэтому оно
+идёт в фоновой задаче, а запросы тем временем получают прежний граф.
+Пока процесс не загрузил граф ни разу, рекомендаций нет.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from core.tasks import run_in_background
+from .models import Follow
+
+LOAD_CHUNK_SIZE = 100000
+# Вес совместной подписки относительно «друга друга»
+COFOLLOW_WEIGHT = 0.5
+# Сколько самых популярных авторов помнить для новичков без подписок
+POPULAR_SIZE = 100
+
+
+def _csr(rows, columns, size):
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, columns[order]
+
+
+def _ranges(starts, lengths):
+    """Индексы starts[i]:starts[i] + lengths[i] для всех i подряд."""
+    return (
+        np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        + np.arange(lengths.sum())
+    )
+
+
+class FollowGraph:
+    """Снимок графа подписок с поправками, накопленными после загрузки."""
+
+    def __init__(self, users, authors):
+        self.size = int(max(users.max(initial=0), authors.max(initial=0))) + 1
+        self.following = _csr(users, authors, self.size)
+        self.followers = _csr(authors, users, self.size)
+        degrees = np.diff(self.followers[0])
+        top = np.argsort(degrees)[::-1][:POPULAR_SIZE]
+        self.popular = top[degrees[top] > 0]
+        self.built = time.monotonic()
+        # Подписки и отписки после загрузки в обе стороны:
+        # user_id -> множество авторов и author_id -> множество читателей
+        self.added = {}
+        self.removed = {}
+        self.added_followers = {}
+        self.removed_followers = {}
+        # Те же поправки массивами для _gather, см. _corrections
+        self._arrays = {}
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Читает posts_follow пачками, не держа в памяти объекты ORM."""
+        chunks = []
+        rows = Follow.objects.values_list('user_id', 'author_id')
+        batch = []
+        for row in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            batch.append(row)
+            if len(batch) == LOAD_CHUNK_SIZE:
+                chunks.append(np.array(batch, dtype=np.int64))
+                batch = []
+        if batch:
+            chunks.append(np.array(batch, dtype=np.int64))
+        edges = (
+            np.concatenate(chunks) if chunks
+            else np.empty((0, 2), dtype=np.int64)
+        )
+        return cls(edges[:, 0], edges[:, 1])
+
+    def _row(self, matrix, node):
+        indptr, indices = matrix
+        if node >= self.size:
+            return indices[:0]
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def is_stale(self):
+        return (
+            time.monotonic() - self.built > settings.FOLLOW_GRAPH_TIMEOUT
+            or self.changes > settings.FOLLOW_GRAPH_MAX_CHANGES
+        )
+
+    def following_of(self, user_id):
+        return self._gather(
+            self.following, [user_id], self.added, self.removed
+        )
+
+    def followers_of(self, author_id):
+        return self._gather(
+            self.followers, [author_id],
+            self.added_followers, self.removed_followers,
+        )
+
+    def _corrections(self, added, removed):
+        """Поправки одной стороны графа в виде массивов NumPy.
+
+        Удалённые рёбра — отсортированные коды owner << 32 | target,
+        добавленные — пары (владелец, сосед), отсортированные
+        по владельцу. Массивы строятся заново только после изменений.
+        """
+        with self.lock:
+            arrays = self._arrays.get(id(added))
+            if arrays is None:
+                removed_codes = np.sort(np.array(
+                    [owner << 32 | target
+                     for owner, targets in removed.items()
+                     for target in targets],
+                    dtype=np.int64,
+                ))
+                pairs = np.array(
+                    sorted((owner, target)
+                           for owner, targets in added.items()
+                           for target in targets),
+                    dtype=np.int64,
+                ).reshape(-1, 2)
+                arrays = (removed_codes, pairs[:, 0], pairs[:, 1])
+                self._arrays[id(added)] = arrays
+        return arrays
+
+    def _gather(self, matrix, nodes, added, removed, limit=None):
+        """Соседи всех nodes одним массивом, с повторами.
+
+        Строки вырезаются из CSR и поправляются разом, без цикла Python
+        по узлам. limit ограничивает число соседей, взятых из каждой
+        строки загруженного графа.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        indptr, indices = matrix
+        loaded = nodes[nodes < self.size]
+        starts = indptr[loaded]
+        lengths = indptr[loaded + 1] - starts
+        if limit is not None:
+            lengths = np.minimum(lengths, limit)
+        neighbours = indices[_ranges(starts, lengths)]
+        removed_codes, added_owners, added_targets = self._corrections(
+            added, removed
+        )
+        if removed_codes.size and neighbours.size:
+            codes = np.repeat(loaded, lengths) << 32 | neighbours
+            found = np.searchsorted(removed_codes, codes)
+            found[found == removed_codes.size] = 0
+            neighbours = neighbours[removed_codes[found] != codes]
+        if added_owners.size:
+            # Каждое вхождение узла в nodes получает своих новых соседей
+            left = np.searchsorted(added_owners, nodes, side='left')
+            right = np.searchsorted(added_owners, nodes, side='right')
+            neighbours = np.concatenate([
+                neighbours, added_targets[_ranges(left, right - left)]
+            ])
+        return neighbours
+
+    def _correct(self, added, removed, owner, target, followed, loaded):
+        if followed == loaded:
+            # Ребро снова такое же, как в загруженном графе
+            added.get(owner, set()).discard(target)
+            removed.get(owner, set()).discard(target)
+        elif followed:
+            added.setdefault(owner, set()).add(target)
+        else:
+            removed.setdefault(owner, set()).add(target)
+
+    def _change(self, user_id, author_id, followed):
+        # Поправка хранится, только если отличается от загруженного графа:
+        # добавленных рёбер в нём нет, удалённые в нём есть
+        loaded = bool(np.isin(author_id, self._row(self.following, user_id)))
+        with self.lock:
+            self._correct(
+                self.added, self.removed,
+                user_id, author_id, followed, loaded,
+            )
+            self._correct(
+                self.added_followers, self.removed_followers,
+                author_id, user_id, followed, loaded,
+            )
+            self._arrays = {}
+            self.changes += 1
+
+    def follow(self, user_id, author_id):
+        self._change(user_id, author_id, followed=True)
+
+    def unfollow(self, user_id, author_id):
+        self._change(user_id, author_id, followed=False)
+
+    def recommend(self, user_id, limit):
+        """id авторов, отсортированные по убыванию оценки."""
+        following = self.following_of(user_id)
+        scores = {}
+        if following.size:
+            friends = self._gather(
+                self.following, following, self.added, self.removed
+            )
+            readers = self._gather(
+                self.followers, following,
+                self.added_followers, self.removed_followers,
+                limit=settings.RECOMMENDATIONS_FOLLOWERS_SAMPLE,
+            )
+            readers = readers[readers != user_id]
+            cofollowed = self._gather(
+                self.following, readers, self.added, self.removed
+            )
+            candidates = np.concatenate([friends, cofollowed])
+            weights = np.concatenate([
+                np.ones(friends.size),
+                np.full(cofollowed.size, COFOLLOW_WEIGHT),
+            ])
+            mask = ~np.isin(candidates, following) & (candidates != user_id)
+            candidates, weights = candidates[mask], weights[mask]
+            if candidates.size:
+                ids, inverse = np.unique(candidates, return_inverse=True)
+                totals = np.bincount(inverse, weights=weights)
+                best = np.argsort(-totals, kind='stable')[:limit]
+                scores = dict(zip(ids[best].tolist(), totals[best].tolist()))
+        result = sorted(scores, key=lambda pk: -scores[pk])
+        # Новичкам и тем, кому мало кандидатов, добавляем популярных
+        for author in self.popular.tolist():
+            if len(result) >= limit:
+                break
+            if (author != user_id and author not in scores
+                    and not np.isin(author, following)):
+                result.append(author)
+        return result[:limit]
+
+
+_graph = None
+_graph_lock = threading.Lock()
+# Подписки и отписки, сделанные во время фоновой перестройки графа:
+# новый граф мог прочитать posts_follow до них, поэтому они
+# применяются к нему ещё раз. None — перестройка не идёт.
+_pending_changes = None
+
+
+def _rebuild():
+    global _graph, _pending_changes
+    try:
+        graph = FollowGraph.load()
+    except Exception:
+        with _graph_lock:
+            _pending_changes = None
+        raise
+    with _graph_lock:
+        for change in _pending_changes:
+            graph._change(*change)
+        _graph, _pending_changes = graph, None
+
+
+def get_graph():
+    """Граф подписок процесса или None, если он ещё не загружен.
+
+    Устаревший граф перестраивается в фоне, а пока отдаётся прежний.
+    """
+    global _pending_changes
+    graph = _graph
+    if graph is None or graph.is_stale():
+        with _graph_lock:
+            rebuild = _pending_changes is None and _graph is graph
+            if rebuild:
+                _pending_changes = []
+        if rebuild:
+            run_in_background(_rebuild)
+        graph = _graph
+    return graph
+
+
+def reset_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+
+def follow_changed(user_id, author_id, followed):
+    """Применяет подписку или отписку к уже загруженному графу."""
+    with _graph_lock:
+        graph = _graph
+        if _pending_changes is not None:
+            _pending_changes.append((user_id, author_id, followed))
+    if graph is not None:
+        graph._change(user_id, author_id, followed)
+
+
+def recommend_authors(user_id, limit=None):
+    """id авторов, на которых стоит подписаться пользователю."""
+    limit = limit or settings.RECOMMENDATIONS_COUNT
+    graph = get_graph()
+    if graph is None:
+        return []
+    return graph.recommend(user_id, limit)
@@ -0,0 +1,123 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Таблица posts_post_fts — внешний (content=) индекс FTS5 над
+posts_post.text: сам текст в ней не хранится, только инвертированный
+индекс. Индекс поддерживают триггеры SQLite на posts_post, поэтому он
+не расходится с данными и при bulk_create, update() и правках в БД.
+Пересобрать индекс и триггеры можно командой rebuild_search_index.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+from .utils import BaseCursorPaginator, CursorPage
+
+FTS_TABLE = 'posts_post_fts'
+
+SCHEMA = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+]
+
+
+def rebuild_index():
+    """Создаёт недостающие таблицу и триггеры и пересобирает индекс.
+
+    Триггеры пропадают, если миграция пересоздаёт таблицу posts_post
+    (так SQLite меняет столбцы), поэтому команда создаёт их заново.
+    """
+    with connection.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"
+        )
+
+
+def build_match(query):
+    """Запрос FTS5 из пользовательской строки или None, если слов нет.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 в строке
+    поиска не ломали запрос; последнее слово ищется по префиксу.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchPaginator(BaseCursorPaginator):
+    """Курсорная паджинация результатов поиска по релевантности.
+
+    Результаты упорядочены по (rank, rowid): rank — оценка bm25 из FTS5,
+    чем меньше, тем релевантнее. Курсор хранит эту пару, и следующая
+    страница выбирается условием «после курсора» без OFFSET.
+    """
+
+    def __init__(self, query, per_page):
+        self.match = build_match(query)
+        self.per_page = int(per_page)
+
+    def cursor_values(self, post):
+        return [post.rank, post.pk]
+
+    def parse_cursor(self, values):
+        rank, pk = values
+        return float(rank), int(pk)
+
+    def _fetch(self, cursor, forward):
+        sql = f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [self.match]
+        if cursor:
+            lookup = '>' if forward else '<'
+            sql += (
+                f' AND (rank {lookup} %s OR (rank = %s AND rowid {lookup} %s))'
+            )
+            params += [cursor[0], cursor[0], cursor[1]]
+        order = '' if forward else ' DESC'
+        sql += f' ORDER BY rank{order}, rowid{order} LIMIT %s'
+        params.append(self.per_page + 1)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            return db_cursor.fetchall()
+
+    def _objects(self, rows):
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for pk, rank in rows]
+        )
+        object_list = []
+        for pk, rank in rows:
+            if pk in posts:
+                posts[pk].rank = rank
+                object_list.append(posts[pk])
+        return object_list
+
+    def get_page(self, after=None, before=None):
+        if self.match is None:
+            return CursorPage([], self)
+        return super().get_page(after, before)
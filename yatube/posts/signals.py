@@ -0,0 +1,169 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import counters, fragments, recommendations, timelines
+from .thumbnails import release_image
+from .caching import (
+    ALL_FEEDS, bump_feeds, group_scope, index_scope, profile_scope
+)
+from .models import AuthorStats, Comment, Follow, Group, Post
+from .utils import feed_count_key
+
+User = get_user_model()
+
+
+@receiver(post_init, sender=Post)
+def remember_post_relations(sender, instance, **kwargs):
+    """Запоминаем автора, группу и картинку поста до их изменения."""
+    # Через __dict__, чтобы не подгружать отложенные (defer) поля
+    instance._loaded_relations = (
+        instance.__dict__.get('author_id'),
+        instance.__dict__.get('group_id'),
+    )
+    image = instance.__dict__.get('image')
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+def _post_feeds(author_ids, group_ids):
+    """Ленты, на которых выводятся посты указанных авторов и групп."""
+    usernames = User.objects.filter(pk__in=author_ids).values_list(
+        'username', flat=True
+    )
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    return (
+        [index_scope()]
+        + [profile_scope(username) for username in usernames]
+        + [group_scope(slug) for slug in slugs]
+    )
+
+
+def _bump_post_feeds(post):
+    author_ids = {post.author_id, post._loaded_relations[0]} - {None}
+    group_ids = {post.group_id, post._loaded_relations[1]} - {None}
+    bump_feeds(*_post_feeds(author_ids, group_ids))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    author_id, group_id = instance._loaded_relations
+    if created:
+        # Новый пост попадает в ленты подписчиков автора
+        timelines.push_post(instance)
+        counters.change_author_stats(instance.author_id, 'posts_count', 1)
+        counters.change_group_posts(instance.group_id, 1)
+        # Ленты групп и профилей считают посты по счётчикам в БД,
+        # в кеше лежит только количество постов главной
+        cache.delete(feed_count_key('index'))
+    elif (author_id, group_id) != (instance.author_id, instance.group_id):
+        if author_id != instance.author_id:
+            # Пост переходит из лент подписчиков прежнего автора в ленты
+            # подписчиков нового
+            timelines.remove_post(instance.pk, author_id)
+            timelines.push_post(instance)
+        counters.change_author_stats(author_id, 'posts_count', -1)
+        counters.change_author_stats(instance.author_id, 'posts_count', 1)
+        counters.change_group_posts(group_id, -1)
+        counters.change_group_posts(instance.group_id, 1)
+    _bump_post_feeds(instance)
+    instance._loaded_relations = (instance.author_id, instance.group_id)
+    image = instance.__dict__.get('image')
+    if image is not None:
+        image = getattr(image, 'name', image)
+        if not created and image != instance._loaded_image:
+            # Картинку заменили или убрали: старый файл может быть
+            # больше никому не нужен
+            release_image(instance._loaded_image)
+        instance._loaded_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    timelines.remove_post(instance.pk, instance.author_id)
+    counters.change_author_stats(instance.author_id, 'posts_count', -1)
+    counters.change_group_posts(instance.group_id, -1)
+    cache.delete(feed_count_key('index'))
+    _bump_post_feeds(instance)
+    release_image(instance.image.name)
+
+
+def _bump_comment_feeds(comment):
+    post = Post.objects.filter(pk=comment.post_id).values(
+        'author_id', 'group_id'
+    ).first()
+    if post:
+        bump_feeds(*_post_feeds([post['author_id']], [post['group_id']]))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_comments(instance.post_id, 1)
+    _bump_comment_feeds(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_post_comments(instance.post_id, -1)
+    _bump_comment_feeds(instance)
+
+
+def _bump_follow_feeds(follow):
+    # Счётчики подписок и кнопка подписки выводятся в профилях
+    usernames = User.objects.filter(
+        pk__in=(follow.user_id, follow.author_id)
+    ).values_list('username', flat=True)
+    bump_feeds(*(profile_scope(username) for username in usernames))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        timelines.add_author(instance.user_id, instance.author_id)
+        recommendations.follow_changed(
+            instance.user_id, instance.author_id, followed=True
+        )
+        counters.change_author_stats(instance.author_id, 'followers_count', 1)
+        counters.change_author_stats(instance.user_id, 'following_count', 1)
+        _bump_follow_feeds(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timelines.remove_author(instance.user_id, instance.author_id)
+    recommendations.follow_changed(
+        instance.user_id, instance.author_id, followed=False
+    )
+    counters.change_author_stats(instance.author_id, 'followers_count', -1)
+    counters.change_author_stats(instance.user_id, 'following_count', -1)
+    _bump_follow_feeds(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, raw=False,
+               **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+    # Вход на сайт обновляет только last_login: карточки не меняются
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    # Имя автора выводится в карточках его постов на всех лентах
+    fragments.bump_version('user', instance.pk)
+    if not created:
+        bump_feeds(ALL_FEEDS)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    fragments.bump_version('user', instance.pk)
+    bump_feeds(ALL_FEEDS)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    fragments.bump_version('group', instance.pk)
+    bump_feeds(ALL_FEEDS)
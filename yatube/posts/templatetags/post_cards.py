@@ -0,0 +1,20 @@
+from django import template
+
+from ..fragments import render_post_cards
+from ..previews import attach_latest_comments
+
+register = template.Library()
+
+
+@register.filter
+def post_cards(page_obj, show_group=False):
+    """Прикрепляет к постам страницы готовые карточки из кеша.
+
+    Последние комментарии в карточку не входят: они меняются чаще
+    самого поста и выбираются для всей страницы одним запросом.
+    """
+    posts = list(page_obj)
+    for post, card in zip(posts, render_post_cards(posts, show_group)):
+        post.card = card
+    attach_latest_comments(posts)
+    return posts
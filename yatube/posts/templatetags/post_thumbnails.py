@@ -0,0 +1,56 @@
+from django import template
+from django.conf import settings
+
+from ..thumbnails import get_ready_thumbnails, schedule_thumbnails
+
+register = template.Library()
+
+
+def _srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails
+    )
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, name='card'):
+    """Картинка поста в <picture> с набором ширин и WebP.
+
+    Варианты берутся из THUMBNAIL_PICTURES; в srcset попадают только
+    уже нарезанные, недостающие ставятся в фоновую очередь. Пока нет
+    ни одного, выводится исходная картинка.
+    """
+    if not post.image:
+        return {'picture': None}
+    config = settings.THUMBNAIL_PICTURES[name]
+    names = [
+        variant for variant in config['webp'] + config['fallback']
+        if variant in settings.THUMBNAIL_VARIANTS
+    ]
+    thumbnails = dict(getattr(post, 'thumbnails', {}))
+    missing = [variant for variant in names if variant not in thumbnails]
+    if missing:
+        found = get_ready_thumbnails([post.image], missing)
+        for variant in missing:
+            thumbnails[variant] = found[(post.image.name, variant)]
+    if not all(thumbnails[variant] for variant in names):
+        schedule_thumbnails(post.image)
+
+    def ready(variants):
+        return sorted(
+            (thumbnails[variant] for variant in variants
+             if variant in names and thumbnails[variant]),
+            key=lambda thumbnail: thumbnail.width,
+        )
+
+    fallback = ready(config['fallback'])
+    if not fallback:
+        return {'picture': {'src': post.image.url}}
+    return {'picture': {
+        'webp': _srcset(ready(config['webp'])),
+        'srcset': _srcset(fallback),
+        'sizes': config['sizes'],
+        'src': fallback[-1].url,
+        'width': fallback[-1].width,
+        'height': fallback[-1].height,
+    }}
@@ -6,6 +6,7 @@ from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
+import hashlib
 import shutil
 import tempfile
 
@@ -152,6 +153,7 @@ class ImgFormsTest(TestCase):
         self.assertEqual(first_object.text,
                          'Тестовый пост1',
                          'Пост не записался')
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertEqual(first_object.image,
-                         'posts/small.gif',
+                         f'posts/{digest[:2]}/{digest}.gif',
                          'Картинка не записалась')
@@ -1,6 +1,12 @@
 from django.test import TestCase
-from ..models import Post, Group
+from ..models import AuthorStats, Comment, Follow, Post, Group
+from ..query_plans import explain, plan_problems
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from io import StringIO
+import json
+import os
+import tempfile
 
 
 User = get_user_model()
@@ -61,3 +67,144 @@ class PostModelTest(TestCase):
                 self.assertEqual(post._meta.get_field(field).help_text,
                                  expected_value,
                                  'Ошибка в help_text')
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.user2 = User.objects.create_user(username='auth2')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.group2 = Group.objects.create(
+            title='Вторая группа',
+            slug='test2_slug',
+            description='Тестовое описание',
+        )
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        self.assertEqual(AuthorStats.objects.get(user=self.user).posts_count,
+                         1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+        post.group = self.group2
+        post.save()
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 0)
+        self.assertEqual(Group.objects.get(pk=self.group2.pk).posts_count,
+                         1)
+        post.delete()
+        self.assertEqual(AuthorStats.objects.get(user=self.user).posts_count,
+                         0)
+        self.assertEqual(Group.objects.get(pk=self.group2.pk).posts_count,
+                         0)
+
+    def test_comment_and_follow_counters(self):
+        """Комментарии и подписки меняют счётчики."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.user2, text='Коммент')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        follow = Follow.objects.create(user=self.user2, author=self.user)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).followers_count, 1
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user2).following_count, 1
+        )
+        follow.delete()
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).followers_count, 0
+        )
+
+    def test_save_does_not_overwrite_counters(self):
+        """Сохранение поста не затирает счётчик свежим комментарием."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.user2, text='Коммент')
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет разошедшиеся счётчики."""
+        Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Group.objects.update(posts_count=10)
+        AuthorStats.objects.filter(user=self.user).delete()
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+        self.assertEqual(AuthorStats.objects.get(user=self.user).posts_count,
+                         1)
+        self.assertIn('группы: проверено 2, исправлено 2', out.getvalue())
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        User.objects.create_user(username='auth2')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+
+    def test_import_posts_command(self):
+        """import_posts вставляет посты пачками и обновляет счётчики."""
+        rows = [
+            {'title': 'Заголовок', 'body': 'Текст', 'userId': self.user.pk},
+            {'body': 'Без заголовка', 'userId': 'auth2',
+             'group': 'test_slug'},
+            {'title': 'Нет автора', 'userId': 999},
+            {'title': 'Нет группы', 'userId': 'auth', 'group': 'missing'},
+        ]
+        lines = [json.dumps(row, ensure_ascii=False) for row in rows]
+        lines.insert(2, '{битая строка')
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', encoding='utf-8', delete=False
+        ) as source:
+            source.write('\n'.join(lines))
+        self.addCleanup(os.remove, source.name)
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_posts', source.name, batch_size=2, stdout=out, stderr=err
+        )
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Без заголовка', 'Заголовок\n\nТекст'],
+        )
+        self.assertEqual(AuthorStats.objects.get(user=self.user).posts_count,
+                         1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+        self.assertIn('Импортировано постов: 2, ошибок: 3', out.getvalue())
+        self.assertIn('Строка 3: некорректный JSON', err.getvalue())
+        self.assertIn('Строка 4: автор 999 не найден', err.getvalue())
+
+
+class QueryPlansTest(TestCase):
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не читают таблицы целиком с сортировкой."""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('идут по индексам', out.getvalue())
+
+    def test_sort_without_index_detected(self):
+        """Сортировка без подходящего индекса находится в плане."""
+        full_scan = Post.objects.order_by('text')
+        by_group = Post.objects.filter(group_id=1).order_by('-text')
+        self.assertTrue(plan_problems(
+            explain(*full_scan.query.sql_with_params()), allow_sort=True
+        ))
+        plan = explain(*by_group.query.sql_with_params())
+        self.assertTrue(plan_problems(plan))
+        self.assertFalse(plan_problems(plan, allow_sort=True))
@@ -4,6 +4,11 @@ from django.contrib.auth import get_user_model
 from http import HTTPStatus
 from django.core.cache import cache
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+
+from ..admin import PostAdmin
 
 User = get_user_model()
 
@@ -177,3 +182,85 @@ class PostUrlsTest(TestCase):
                 self.assertRedirects(
                     response, redirect_urls
                 )
+
+
+class AdminUrlsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for number in range(5):
+            post = Post.objects.create(
+                author=cls.admin, text=f'Пост номер {number}', group=cls.group
+            )
+            Comment.objects.create(
+                author=cls.admin, text='Тестовый коммент', post=post
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        cache.clear()
+
+    def test_changelists_available(self):
+        """Списки постов, комментариев и подписок открываются в админке."""
+        for model in ('post', 'comment', 'follow', 'group'):
+            with self.subTest(model=model):
+                response = self.client.get(
+                    reverse(f'admin:posts_{model}_changelist')
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_post_changelist_queries_do_not_grow(self):
+        """Автор и группа постов не подгружаются отдельными запросами."""
+        url = reverse('admin:posts_post_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        Post.objects.create(
+            author=self.admin, text='Ещё один пост', group=self.group
+        )
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_post_search_uses_fts(self):
+        """Поиск постов в админке идёт по полнотекстовому индексу."""
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'номер 3'}
+        )
+        self.assertEqual(
+            [post.text for post in response.context['cl'].result_list],
+            ['Пост номер 3'],
+        )
+
+    def test_post_changelist_is_paginated(self):
+        """Список постов в админке делится на страницы."""
+        per_page = 3
+        with patch.object(PostAdmin, 'list_per_page', per_page):
+            response = self.client.get(reverse('admin:posts_post_changelist'))
+            cl = response.context['cl']
+            self.assertTrue(cl.multi_page)
+            self.assertEqual(cl.result_count, 5)
+            self.assertEqual(len(cl.result_list), per_page)
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'p': 1}
+            )
+            self.assertEqual(len(response.context['cl'].result_list), 2)
+
+    def test_changelist_count_cached_per_filter(self):
+        """COUNT списка в админке кешируется отдельно для каждого фильтра."""
+        url = reverse('admin:posts_post_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+        response = self.client.get(url, {'q': 'номер 3'})
+        self.assertEqual(response.context['cl'].result_count, 1)
@@ -0,0 +1,139 @@
+from django.test import TestCase, Client, override_settings
+from ..models import Post, Group
+from ..utils import (
+    CursorPaginator, estimate_count, feed_count_key, get_feed_count
+)
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+import datetime
+
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(1, 14):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост {i}',
+                group=cls.group
+            )
+        # Часть постов с одинаковой датой: порядок задаёт id
+        Post.objects.filter(text__in=(
+            'Тестовый пост 5', 'Тестовый пост 6', 'Тестовый пост 7'
+        )).update(created=datetime.datetime(2022, 1, 1))
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_pages_cover_all_posts_once(self):
+        """Курсорные страницы по порядку содержат все посты без повторов."""
+        paginator = CursorPaginator(Post.objects.all(), 4)
+        expected = list(
+            Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True)
+        )
+        seen = []
+        page = paginator.get_page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertEqual(seen, expected, 'Посты потерялись или повторились')
+
+    def test_previous_page_returns_same_posts(self):
+        """Курсор «назад» возвращает предыдущую страницу."""
+        paginator = CursorPaginator(Post.objects.all(), 4)
+        first = paginator.get_page()
+        second = paginator.get_page(after=first.next_cursor)
+        back = paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор приводит на первую страницу."""
+        paginator = CursorPaginator(Post.objects.all(), 4)
+        self.assertEqual(
+            list(paginator.get_page(after='broken')),
+            list(paginator.get_page()),
+        )
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_views_use_cursor_pagination(self):
+        """Ленты листаются по курсору при CURSOR_PAGINATION."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), 10)
+                response = self.authorized_client.get(
+                    url, {'after': page_obj.next_cursor}
+                )
+                self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class FeedCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(1, 4):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост {i}',
+                group=cls.group
+            )
+
+    def setUp(self):
+        self.key = feed_count_key('index')
+        cache.clear()
+
+    def test_count_served_from_cache(self):
+        """Повторный подсчёт ленты не обращается к БД."""
+        posts = Post.objects.all()
+        self.assertEqual(get_feed_count(posts, self.key), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_feed_count(posts, self.key), 3)
+
+    def test_count_invalidated_on_create_and_delete(self):
+        """Создание и удаление поста сбрасывают закешированный счётчик."""
+        posts = Post.objects.all()
+        get_feed_count(posts, self.key)
+        post = Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group
+        )
+        self.assertEqual(get_feed_count(posts, self.key), 4)
+        post.delete()
+        self.assertEqual(get_feed_count(posts, self.key), 3)
+
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=2)
+    def test_estimated_count(self):
+        """Оценка не меньше порога и не меньше реального количества."""
+        self.assertGreaterEqual(estimate_count(Post.objects.all()), 3)
+        with override_settings(PAGINATOR_ESTIMATE_THRESHOLD=10):
+            self.assertEqual(estimate_count(Post.objects.all()), 3)
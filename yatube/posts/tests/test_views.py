@@ -1,14 +1,36 @@
-from django.test import TestCase, Client, override_settings
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings
+)
 from ..models import Post, Group, Comment, Follow
+from .. import recommendations, timelines
+from ..caching import get_generation, index_scope
+from ..thumbnails import (
+    generate_thumbnails, get_ready_thumbnail, prefetch_thumbnails,
+    source_file,
+)
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django import forms
 import datetime
 from django.core.cache import cache
+import os
 import shutil
 import tempfile
+import threading
+import time
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from PIL import Image
+from sorl.thumbnail import delete
+import gzip
+import json
+from unittest import mock
+from django.utils.text import compress_string
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -322,6 +344,7 @@ class ImgViewsTest(TestCase):
         self.authorized_client = Client()
         # Авторизуем пользователя
         self.authorized_client.force_login(self.user)
+        cache.clear()
 
     def test_image_in_new_post(self):
         """Новый пост выдается с картинкой."""
@@ -344,41 +367,424 @@ class ImgViewsTest(TestCase):
                 response = self.authorized_client.get(reverse_name)
                 self.assertEqual(
                     response.context.get('post').image,
-                    'posts/small.gif',
+                    self.post.image.name,
                     'Картинка не появилась'
                 )
 
+    @override_settings(
+        THUMBNAIL_VARIANTS={'card': ('2x1', {'upscale': False})}
+    )
+    def test_thumbnail_generated_off_request(self):
+        """Пока миниатюры нет, выводится картинка, затем — миниатюра."""
+        cache.clear()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.assertIsNone(get_ready_thumbnail(self.post.image, 'card'))
+        response = self.authorized_client.get(url)
+        self.assertContains(response, self.post.image.url)
+        generate_thumbnails(self.post.image.name)
+        thumbnail = get_ready_thumbnail(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, thumbnail.url)
+
+    # Другой размер: найденные миниатюры остаются в LRU процесса
+    @override_settings(
+        THUMBNAIL_VARIANTS={'card': ('3x1', {'upscale': False})}
+    )
+    def test_feed_card_shows_thumbnail_without_post_save(self):
+        """Готовая миниатюра сбрасывает карточку, не сохраняя пост."""
+        cache.clear()
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertContains(self.authorized_client.get(url),
+                            self.post.image.url)
+        updated = Post.objects.get(pk=self.post.pk).updated
+        generate_thumbnails(self.post.image.name)
+        thumbnail = get_ready_thumbnail(self.post.image, 'card')
+        self.assertContains(self.authorized_client.get(url), thumbnail.url)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).updated, updated)
+
+    @override_settings(
+        THUMBNAIL_VARIANTS={'card': ('4x1', {'upscale': False})},
+        THUMBNAIL_LRU_TIMEOUT=60,
+    )
+    def test_thumbnail_lru_entry_expires(self):
+        """Миниатюра, удалённая другим воркером, пропадает из LRU."""
+        cache.clear()
+        generate_thumbnails(self.post.image.name)
+        self.assertIsNotNone(get_ready_thumbnail(self.post.image, 'card'))
+        # Так миниатюры удаляет очистка медиафайлов в другом процессе
+        delete(source_file(self.post.image.name), delete_file=False)
+        self.assertIsNotNone(get_ready_thumbnail(self.post.image, 'card'))
+        later = time.monotonic() + 61
+        with mock.patch('posts.thumbnails.time.monotonic',
+                        return_value=later):
+            self.assertIsNone(get_ready_thumbnail(self.post.image, 'card'))
+
+    @override_settings(THUMBNAIL_VARIANTS={
+        'card': ('2x1', {'upscale': False, 'format': 'PNG'}),
+        'card_webp': ('2x1', {'upscale': False, 'format': 'WEBP'}),
+    })
+    def test_picture_with_webp_srcset(self):
+        """Готовые варианты выводятся в srcset с WebP и размерами."""
+        cache.clear()
+        generate_thumbnails(self.post.image.name)
+        webp = get_ready_thumbnail(self.post.image, 'card_webp')
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{webp.url} 2w')
+        self.assertTrue(webp.name.endswith('.webp'))
+        self.assertContains(response, 'width="2" height="1"')
+
+    def test_page_thumbnails_looked_up_in_one_query(self):
+        """Миниатюры всех карточек ищутся одним запросом к KVStore."""
+        cache.clear()
+        posts = [
+            Post.objects.create(
+                author=self.user, text='Пост', image=f'posts/{number}.gif'
+            )
+            for number in range(3)
+        ]
+        for attempt, expected in enumerate((1, 0)):
+            with self.subTest(attempt=attempt):
+                with CaptureQueriesContext(connection) as queries:
+                    prefetch_thumbnails(posts)
+                kvstore_queries = [
+                    query for query in queries
+                    if 'thumbnail_kvstore' in query['sql']
+                ]
+                self.assertEqual(len(kvstore_queries), expected)
+                self.assertEqual(
+                    posts[0].thumbnails,
+                    dict.fromkeys(settings.THUMBNAIL_VARIANTS),
+                )
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_VARIANTS={},
+    BACKGROUND_TASKS_EAGER=True,
+    MEDIA_MIN_AGE=0,
+)
+class ImageReferencesTest(TransactionTestCase):
+    # Файлы удаляются после фиксации транзакции, поэтому без обёртки
+    # теста в транзакцию
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('image.gif', content, 'image/gif'),
+        )
+
+    def test_last_reference_deletes_file(self):
+        """Файл общий для одинаковых картинок и живёт, пока нужен."""
+        first = self.create_post(b'GIF89a')
+        second = self.create_post(b'GIF89a')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.image = SimpleUploadedFile('new.gif', b'GIF87a', 'image/gif')
+        second.save()
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(second.image.name))
+
+    @override_settings(MEDIA_MIN_AGE=60 * 60)
+    def test_reupload_keeps_released_file(self):
+        """Старый файл, загруженный заново, не удаляется с прежним постом."""
+        first = self.create_post(b'GIF89a')
+        name = first.image.name
+        past = datetime.datetime.now().timestamp() - 2 * 60 * 60
+        os.utime(self.storage.path(name), (past, past))
+        # Такая же картинка для нового поста, который ещё не сохранён
+        self.storage.save('posts/image.gif', ContentFile(b'GIF89a'))
+        self.assertLess(self.storage.age(name), 60)
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+
+    def test_dedupe_command_merges_copies(self):
+        """Команда сливает старые копии одной картинки в один файл."""
+        names = []
+        for number in range(2):
+            name = f'posts/image_{number}.gif'
+            path = self.storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as image:
+                image.write(b'GIF89a')
+            Post.objects.create(author=self.user, text='Пост', image=name)
+            names.append(name)
+        call_command('dedupe_post_images', stdout=StringIO())
+        images = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(images), 1)
+        self.assertTrue(self.storage.exists(images.pop()))
+        for name in names:
+            self.assertFalse(self.storage.exists(name))
+
+
+def gif(color):
+    content = BytesIO()
+    Image.new('RGB', (2, 1), color).save(content, 'GIF')
+    return content.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_VARIANTS={'card': ('2x1', {'upscale': False})},
+)
+class MediaGarbageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'gc.json')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, color):
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('image.gif', gif(color), 'image/gif'),
+        )
+        generate_thumbnails(post.image.name)
+        return post
+
+    def write_file(self, name):
+        path = self.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'garbage')
+
+    def age_files(self):
+        past = datetime.datetime.now().timestamp() - 2 * 60 * 60
+        for root, dirs, names in os.walk(self.storage.location):
+            for name in names:
+                os.utime(os.path.join(root, name), (past, past))
+
+    def test_collects_orphans_in_resumable_batches(self):
+        """Сборка удаляет только мусор и продолжается с контрольной точки."""
+        kept = self.create_post((255, 0, 0))
+        kept_thumbnail = get_ready_thumbnail(kept.image, 'card')
+        gone = self.create_post((0, 0, 255))
+        gone_thumbnail = get_ready_thumbnail(gone.image, 'card')
+        # Удаление без сигналов: файлы и записи KVStore остаются
+        Post.objects.filter(pk=gone.pk).delete()
+        self.write_file('posts/old_copy.gif')
+        self.write_file('cache/00/00/orphan.jpg')
+        self.age_files()
+        self.write_file('posts/just_uploaded.gif')
+        options = {
+            'checkpoint': self.checkpoint, 'batch_size': 2, 'pause': 0,
+            'stdout': StringIO(),
+        }
+        call_command('collect_media_garbage', max_batches=2, **options)
+        self.assertTrue(os.path.exists(self.checkpoint))
+        call_command('collect_media_garbage', **options)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        for name in (kept.image.name, kept_thumbnail.name,
+                     'posts/just_uploaded.gif'):
+            with self.subTest(kept=name):
+                self.assertTrue(self.storage.exists(name))
+        for name in (gone.image.name, gone_thumbnail.name,
+                     'posts/old_copy.gif', 'cache/00/00/orphan.jpg'):
+            with self.subTest(deleted=name):
+                self.assertFalse(self.storage.exists(name))
+        self.assertIsNotNone(get_ready_thumbnail(kept.image, 'card'))
+
+    def test_reuploaded_orphan_kept(self):
+        """Забытый файл, загруженный заново, сборка не удаляет."""
+        post = self.create_post((0, 255, 0))
+        Post.objects.filter(pk=post.pk).delete()
+        self.age_files()
+        self.storage.save('posts/image.gif', ContentFile(gif((0, 255, 0))))
+        call_command(
+            'collect_media_garbage', checkpoint=self.checkpoint, pause=0,
+            stdout=StringIO(),
+        )
+        self.assertTrue(self.storage.exists(post.image.name))
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов к БД не зависит от количества постов на странице."""
+    # Бюджет запросов на страницу: сессия, пользователь, данные страницы;
+    # у лент ещё запрос последних комментариев, у поста — версии для ETag,
+    # у ленты подписок — профили рекомендованных авторов
+    QUERY_BUDGET = {
+        'posts:index': 5,
+        'posts:group_list': 5,
+        'posts:profile': 6,
+        'posts:post_detail': 5,
+        'posts:follow_index': 6,
+    }
 
-class CacheViewsTest(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
         cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
         cls.group = Group.objects.create(
             title='Тестовая группа',
             slug='test_slug',
             description='Тестовое описание',
         )
-        cls.post = Post.objects.create(
-            author=cls.user,
-            text='Тестовый пост',
-            group=cls.group
-        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                author=self.user,
+                text=f'Тестовый пост {i}',
+                group=self.group,
+            )
+            Comment.objects.create(
+                author=self.reader, text='Тестовый коммент', post=post
+            )
+        return post
 
+    def count_queries(self, post):
+        urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ),
+            'posts:profile': reverse(
+                'posts:profile', kwargs={'username': self.user.username}
+            ),
+            'posts:post_detail': reverse(
+                'posts:post_detail', kwargs={'post_id': post.pk}
+            ),
+            'posts:follow_index': reverse('posts:follow_index'),
+        }
+        queries = {}
+        # Граф подписок загружается раз на процесс, а не на запрос
+        recommendations.get_graph()
+        for name, url in urls.items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.authorized_client.get(url)
+            queries[name] = len(context)
+        return queries
+
+    def test_query_budget(self):
+        """Страницы укладываются в бюджет запросов при любом размере."""
+        small = self.count_queries(self.add_posts(2))
+        large = self.count_queries(self.add_posts(10))
+        for name, budget in self.QUERY_BUDGET.items():
+            with self.subTest(page=name):
+                self.assertLessEqual(
+                    large[name], budget,
+                    f'Страница {name} превысила бюджет запросов'
+                )
+                self.assertEqual(
+                    small[name], large[name],
+                    f'Число запросов на {name} растёт с числом постов'
+                )
+
+
+class CacheViewsTest(TransactionTestCase):
+    # Кеш лент и карточек сбрасывается после фиксации транзакции,
+    # поэтому без обёртки теста в транзакцию
     def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            group=self.group
+        )
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
+    def test_cached_page_stored_compressed(self):
+        """Страница кешируется сжатой и из кеша не пережимается."""
+        cache.clear()
+        url = reverse('posts:index')
+        with mock.patch(
+            'posts.caching.compress_string', wraps=compress_string
+        ) as compress:
+            first = self.guest_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            second = self.guest_client.get(
+                url, HTTP_ACCEPT_ENCODING='gzip, deflate, br'
+            )
+        self.assertEqual(compress.call_count, 1)
+        for response in (first, second):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(first.content, second.content)
+        plain = self.guest_client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+
+    def test_feeds_bumped_after_commit(self):
+        """После фиксации транзакции поколение ленты меняется ещё раз.
+
+        Страница, закешированная до фиксации, уже не найдётся.
+        """
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Новый пост')
+            generation = get_generation(index_scope())
+        self.assertNotEqual(get_generation(index_scope()), generation)
+
+    def test_cached_page_not_shared_between_users(self):
+        """Закешированная страница одного пользователя не видна другим."""
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        Follow.objects.create(user=alice, author=self.user)
+        profile_url = reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        )
+        self.client.force_login(alice)
+        self.assertContains(self.client.get(profile_url), 'Отписаться')
+        self.client.force_login(bob)
+        response = self.client.get(profile_url)
+        self.assertNotContains(response, 'Отписаться')
+        self.assertContains(response, 'Пользователь: bob')
+        self.client.get(reverse('posts:index'))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пользователь:')
+
+    def test_cached_pages_not_cached_by_browser(self):
+        """Браузер не хранит страницы лент: сброс кеша виден сразу."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for client in (self.guest_client, self.authorized_client):
+            for url in pages:
+                # Второй запрос отдаётся из кеша сервера
+                for _ in range(2):
+                    with self.subTest(url=url):
+                        response = client.get(url)
+                        cache_control = response['Cache-Control']
+                        self.assertIn('max-age=0', cache_control)
+                        self.assertIn('private', cache_control)
+                        self.assertFalse(response.has_header('Expires'))
+
     def test_cache_index_page(self):
         """Проверка кеширования главной страницы"""
         response = self.authorized_client.get(reverse('posts:index'))
         initial_content = response.content.decode()
-        self.post = Post.objects.create(
-            text='Тестовый пост2',
-            author=self.user,
-            group=self.group,
-        )
+        # update() не отправляет сигналов: страница остаётся в кеше
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
         response = self.authorized_client.get(reverse('posts:index'))
         # Проверяем, что страница не поменялась, все посты из кеша
         self.assertEqual(
@@ -395,6 +801,84 @@ class CacheViewsTest(TestCase):
             'Содержание страницы не изменилось'
         )
 
+    def test_new_post_invalidates_cached_pages(self):
+        """Новый пост сразу виден на закешированных страницах."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in pages:
+            self.guest_client.get(url)
+        Post.objects.create(
+            text='Тестовый пост2',
+            author=self.user,
+            group=self.group,
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Тестовый пост2')
+
+    def test_edit_and_group_change_invalidate_cached_pages(self):
+        """Правка поста и группы сбрасывают закешированные страницы."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        self.assertContains(self.guest_client.get(url),
+                            'Отредактированный пост')
+        self.group.description = 'Новое описание'
+        self.group.save()
+        self.assertContains(self.guest_client.get(url), 'Новое описание')
+
+
+class PostCardCacheTest(TransactionTestCase):
+    # Кеш лент и карточек сбрасывается после фиксации транзакции,
+    # поэтому без обёртки теста в транзакцию
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            group=self.group
+        )
+        self.guest_client = Client()
+        self.url = reverse('posts:group_list',
+                           kwargs={'slug': self.group.slug})
+        cache.clear()
+
+    def test_card_rendered_from_cache(self):
+        """Неизменённая карточка поста берётся из кеша."""
+        self.guest_client.get(self.url)
+        # update() не меняет версию поста: карточка остаётся прежней
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        response = self.guest_client.get(self.url)
+        self.assertContains(response, 'Тестовый пост')
+        self.assertNotContains(response, 'Тихая правка')
+
+    def test_card_rerendered_after_edit(self):
+        """После сохранения поста карточка отрисовывается заново."""
+        self.guest_client.get(self.url)
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        response = self.guest_client.get(self.url)
+        self.assertContains(response, 'Отредактированный пост')
+
+    def test_card_rerendered_after_author_change(self):
+        """Изменение автора сбрасывает карточки его постов."""
+        self.guest_client.get(self.url)
+        self.user.first_name = 'Лев'
+        self.user.last_name = 'Толстой'
+        self.user.save()
+        response = self.guest_client.get(self.url)
+        self.assertContains(response, 'Лев Толстой')
+
 
 class CommentViewsTest(TestCase):
     @classmethod
@@ -467,19 +951,17 @@ class CommentViewsTest(TestCase):
         )
 
 
-class FollowViewsTest(TestCase):
-    @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        cls.user = User.objects.create_user(username='auth')
-        cls.user2 = User.objects.create_user(username='subscriber')
-        cls.user3 = User.objects.create_user(username='non_subscriber')
-        cls.post = Post.objects.create(
+class FollowViewsTest(TransactionTestCase):
+    # Ленты подписок меняются после фиксации транзакции, поэтому
+    # без обёртки теста в транзакцию
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.user2 = User.objects.create_user(username='subscriber')
+        self.user3 = User.objects.create_user(username='non_subscriber')
+        self.post = Post.objects.create(
             text='Тестовый пост',
-            author=cls.user
+            author=self.user
         )
-
-    def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user2)
         self.authorized_client2 = Client()
@@ -533,3 +1015,503 @@ class FollowViewsTest(TestCase):
             self.post,
             'Пост появился в ленте неподписанного пользователя'
         )
+
+    def test_new_post_pushed_to_cached_timeline(self):
+        """Новый пост дописывается в уже собранную ленту подписчика."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        new_post = Post.objects.create(text='Новый пост', author=self.user)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'][0],
+            new_post,
+            'Новый пост не попал в ленту подписчика'
+        )
+
+    def test_follow_and_unfollow_update_timeline(self):
+        """Подписка дополняет ленту, отписка очищает её."""
+        self.authorized_client.get(reverse('posts:follow_index'))
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user.username})
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user.username})
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(
+        TIMELINE_FANOUT_SYNC_LIMIT=0, BACKGROUND_TASKS_EAGER=True
+    )
+    def test_fan_out_for_popular_author(self):
+        """Для популярных авторов раскладка идёт через фоновую задачу."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        new_post = Post.objects.create(text='Новый пост', author=self.user)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_deleted_posts_removed_from_cached_timeline(self):
+        """Удалённые посты сразу пропадают из собранной ленты."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(11)
+        ]
+        self.authorized_client.get(reverse('posts:follow_index'))
+        deleted_ids = {post.pk for post in posts[-3:]}
+        for post in posts[-3:]:
+            post.delete()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 9)
+        self.assertEqual(len(page_obj), settings.COUNT_POSTS - 1)
+        self.assertFalse(
+            deleted_ids & {post.pk for post in page_obj}
+        )
+
+    def test_author_change_moves_post_between_timelines(self):
+        """Пост, переданный другому автору, переезжает в его ленты."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        Follow.objects.create(user=self.user3, author=self.user2)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        self.authorized_client2.get(reverse('posts:follow_index'))
+        post = Post.objects.get(pk=self.post.pk)
+        post.author = self.user2
+        post.save()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.authorized_client2.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_fan_out_waits_for_timeline_rebuild(self):
+        """Пост дописывается в ленту, которую в этот момент собирают."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        key = timelines.timeline_key(self.user2.pk)
+
+        def finish_rebuild():
+            # Сборка прочитала БД до нового поста
+            cache.set(key, [])
+            cache.delete(timelines.lock_key(key))
+
+        cache.set(timelines.lock_key(key), True)
+        rebuild = threading.Timer(0.1, finish_rebuild)
+        rebuild.start()
+        new_post = Post.objects.create(text='Новый пост', author=self.user)
+        rebuild.join()
+        self.assertEqual(timelines.get_timeline(self.user2.pk), [new_post.pk])
+
+    def test_busy_timeline_dropped_instead_of_merged(self):
+        """Ленту, занятую другим процессом, сбрасываем, а не дописываем."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        key = timelines.timeline_key(self.user2.pk)
+        cache.set(timelines.lock_key(key), True)
+        with mock.patch.object(timelines, 'LOCK_WAIT', 0):
+            new_post = Post.objects.create(text='Новый пост', author=self.user)
+        self.assertIsNone(cache.get(key))
+        cache.delete(timelines.lock_key(key))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+
+class RecommendationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.friend = User.objects.create_user(username='friend')
+        cls.neighbour = User.objects.create_user(username='neighbour')
+        cls.similar = User.objects.create_user(username='similar')
+        for user, author in (
+            (cls.reader, cls.author),
+            (cls.author, cls.friend),
+            (cls.neighbour, cls.author),
+            (cls.neighbour, cls.similar),
+        ):
+            Follow.objects.create(user=user, author=author)
+
+    def setUp(self):
+        recommendations.reset_graph()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_friends_of_friends_before_cofollowed(self):
+        """Друзья друзей идут раньше совместных подписок."""
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['recommended_authors'][:2],
+            [self.friend, self.similar],
+        )
+        self.assertNotIn(
+            self.author, response.context['recommended_authors']
+        )
+
+    def test_new_user_gets_popular_authors(self):
+        """Без подписок рекомендуются самые читаемые авторы."""
+        newbie = User.objects.create_user(username='newbie')
+        self.assertEqual(
+            recommendations.recommend_authors(newbie.pk)[0], self.author.pk
+        )
+
+    def test_follow_updates_loaded_graph(self):
+        """Подписка и отписка меняют граф без его перезагрузки."""
+        graph = recommendations.get_graph()
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.friend.username})
+        )
+        with self.assertNumQueries(0):
+            self.assertNotIn(
+                self.friend.pk,
+                recommendations.recommend_authors(self.reader.pk),
+            )
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author.username})
+        )
+        self.assertNotIn(
+            self.author.pk, graph.following_of(self.reader.pk).tolist()
+        )
+        self.assertIs(recommendations.get_graph(), graph)
+
+    def test_stale_graph_rebuilt_in_background(self):
+        """Устаревший граф перестраивается в фоне, пока отдаётся прежний."""
+        graph = recommendations.get_graph()
+        # Снимок posts_follow, прочитанный до подписки ниже
+        snapshot = recommendations.FollowGraph.load()
+        with mock.patch.object(
+            recommendations, 'run_in_background'
+        ) as run_in_background, override_settings(FOLLOW_GRAPH_TIMEOUT=-1):
+            with self.assertNumQueries(0):
+                self.assertIs(recommendations.get_graph(), graph)
+                self.assertIs(recommendations.get_graph(), graph)
+            run_in_background.assert_called_once()
+            Follow.objects.create(user=self.reader, author=self.friend)
+            rebuild = run_in_background.call_args[0][0]
+            with mock.patch.object(
+                recommendations.FollowGraph, 'load', return_value=snapshot
+            ):
+                rebuild()
+        self.assertIs(recommendations.get_graph(), snapshot)
+        # Подписка во время перестройки не потерялась в новом графе
+        self.assertIn(
+            self.friend.pk, snapshot.following_of(self.reader.pk).tolist()
+        )
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.best = Post.objects.create(
+            author=cls.user, text='Котики котики котики'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user, text='Про котиков и собак'
+        )
+        cls.unrelated = Post.objects.create(
+            author=cls.user, text='Погода на завтра'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:search')
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        return list(response.context['page_obj'])
+
+    def test_search_ranked_and_prefix(self):
+        """Поиск находит посты по префиксу слова, релевантные — выше."""
+        self.assertEqual(self.search('котик'), [self.best, self.other])
+        self.assertEqual(self.search('КОТИКИ'), [self.best])
+        self.assertEqual(self.search('*"'), [])
+
+    def test_index_follows_changes(self):
+        """Правка и удаление поста сразу видны в поиске."""
+        Post.objects.filter(pk=self.unrelated.pk).update(
+            text='Котики в дождь'
+        )
+        self.assertIn(self.unrelated, self.search('дождь'))
+        self.assertEqual(self.search('погода'), [])
+        Post.objects.filter(pk=self.best.pk).delete()
+        self.assertNotIn(self.best, self.search('котики'))
+
+    @override_settings(COUNT_POSTS=1)
+    def test_search_cursor_pagination(self):
+        """Результаты листаются курсором в порядке релевантности."""
+        response = self.client.get(self.url, {'q': 'котик'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), [self.best])
+        response = self.client.get(
+            self.url, {'q': 'котик', 'after': page_obj.next_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), [self.other])
+        self.assertFalse(page_obj.has_next())
+        response = self.client.get(
+            self.url, {'q': 'котик', 'before': page_obj.previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), [self.best])
+
+    def test_rebuild_search_index(self):
+        """Команда восстанавливает индекс после правок в обход триггеров."""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_insert')
+        post = Post.objects.create(author=self.user, text='Пропущенный')
+        self.assertEqual(self.search('пропущенный'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('пропущенный'), [post])
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост в группе', group=cls.group
+        )
+        cls.other = Post.objects.create(author=cls.admin, text='Другой пост')
+        Comment.objects.create(
+            post=cls.post, author=cls.admin, text='Коммент'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def export(self, kind, **params):
+        response = self.client.get(
+            reverse('posts:export', kwargs={'kind': kind}), params
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson_with_filters(self):
+        """Выгрузка NDJSON учитывает фильтры по автору и группе."""
+        rows = [
+            json.loads(line)
+            for line in self.export('posts', author='auth').splitlines()
+        ]
+        self.assertEqual([row['id'] for row in rows], [self.post.pk])
+        self.assertEqual(rows[0]['group__slug'], 'test_slug')
+        comments = self.export('comments', group='test_slug')
+        self.assertEqual(json.loads(comments)['text'], 'Коммент')
+        self.assertEqual(self.export('posts', until='2000-01-01'), '')
+
+    def test_export_csv(self):
+        """CSV-выгрузка начинается с заголовка и содержит все строки."""
+        lines = self.export('posts', format='csv').splitlines()
+        self.assertTrue(lines[0].startswith('id,created,updated'))
+        self.assertEqual(len(lines), 3)
+
+    def test_export_only_for_staff(self):
+        """Выгрузка недоступна обычным пользователям."""
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('posts:export', kwargs={'kind': 'posts'})
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command(self):
+        """Команда export_posts пишет ту же выгрузку в stdout."""
+        out = StringIO()
+        call_command('export_posts', 'posts', since='2000-01-01', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ApiTest(TransactionTestCase):
+    # ETag лент меняется после фиксации транзакции
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        cache.clear()
+
+    def test_feeds_json(self):
+        """Ленты API отдают посты в JSON с курсорами."""
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group', kwargs={'slug': self.group.slug}),
+            reverse('posts:api_profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(data['results'][0]['group'], 'test_slug')
+                self.assertIsNone(data['next'])
+        response = self.client.get(
+            reverse('posts:api_group', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed_not_modified(self):
+        """Повторный запрос ленты с ETag получает 304 без запросов к БД."""
+        url = reverse('posts:api_index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_post_not_modified_until_commented(self):
+        """Пост отдаёт 304, пока к нему не добавили комментарий."""
+        url = reverse('posts:api_post', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['text'], 'Тестовый пост')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comments_count'], 1)
+
+
+class ConditionalViewsTest(TransactionTestCase):
+    # ETag лент меняется после фиксации транзакции
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}),
+        )
+
+    def test_not_modified_until_changed(self):
+        """Страницы отдают 304, пока не появился новый комментарий."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.reader, text='Ок')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_last_modified(self):
+        """По If-Modified-Since страница поста отдаёт 304."""
+        url = self.urls[0]
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_user(self):
+        """У другого пользователя ETag страницы другой."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.client.force_login(self.user)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.client.force_login(self.reader)
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        for number in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Коммент {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_paginated(self):
+        """На странице поста первая страница комментариев и ссылка дальше."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['Коммент 0', 'Коммент 1'],
+        )
+        self.assertContains(response, comments.next_cursor)
+
+    def test_comments_fragment(self):
+        """Следующие страницы отдаются фрагментом за постоянное число
+        запросов."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        texts = []
+        after = ''
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(url, {'after': after})
+            self.assertTemplateNotUsed(response, 'base.html')
+            comments = response.context['comments']
+            texts += [comment.text for comment in comments]
+            if not comments.has_next():
+                break
+            after = comments.next_cursor
+        self.assertEqual(texts, [f'Коммент {number}' for number in range(5)])
+
+
+@override_settings(FEED_COMMENT_PREVIEWS=2)
+class CommentPreviewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        cls.quiet = Post.objects.create(author=cls.user, text='Без отзывов')
+        for number in range(4):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Коммент {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_shows_latest_comments(self):
+        """Под постом в ленте — число и последние комментарии."""
+        response = self.client.get(reverse('posts:index'))
+        posts = {post.pk: post for post in response.context['page_obj']}
+        self.assertEqual(
+            [comment.text for comment in posts[self.post.pk].latest_comments],
+            ['Коммент 2', 'Коммент 3'],
+        )
+        self.assertEqual(posts[self.quiet.pk].latest_comments, [])
+        self.assertContains(response, 'Комментариев: 4')
+        self.assertNotContains(response, 'Коммент 1')
@@ -0,0 +1,264 @@
+"""Заранее нарезанные миниатюры картинок постов.
+
+Раньше миниатюры создавал тег {% thumbnail %} при первой отрисовке
+страницы, и ресайз картинки оплачивал случайный читатель ленты. Теперь
+все варианты из THUMBNAIL_VARIANTS нарезаются в пуле фоновых задач сразу
+после сохранения поста, а шаблоны только ищут готовую миниатюру и, пока
+её нет, показывают исходную картинку. Миниатюры всех карточек страницы
+ищутся в KVStore sorl одним пакетным запросом.
+
+Картинки постов лежат в ContentHashStorage: одинаковые загрузки — один
+файл с общими миниатюрами. Файл и его миниатюры удаляются, когда на
+картинку не ссылается ни один пост (release_image).
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.tasks import run_in_background
+
+from .caching import bump_feeds, group_scope, index_scope, profile_scope
+from .models import Post
+
+# Найденные миниатюры: ключ KVStore -> (ImageFile, когда устареет),
+# не больше THUMBNAIL_LRU_SIZE штук на процесс
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def pending_key(name):
+    return f'thumbnail_pending:{name}'
+
+
+def image_version_key(name):
+    """Версия картинки в ключе карточки: меняется, когда готовы миниатюры."""
+    return f'card_version:image:{name}'
+
+
+def _thumbnail_options(source, options):
+    # Те же опции по умолчанию, что подставляет ThumbnailBackend,
+    # иначе имя файла миниатюры не совпадёт с нарезанным
+    backend = default.backend
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def source_file(image):
+    """ImageFile картинки поста в хранилище поля Post.image.
+
+    Ключи KVStore и имена миниатюр sorl зависят от хранилища исходника,
+    поэтому и по имени, и по FieldFile картинка открывается одинаково.
+    """
+    return ImageFile(
+        getattr(image, 'name', image), Post._meta.get_field('image').storage
+    )
+
+
+def thumbnail_file(image, variant):
+    """ImageFile миниатюры варианта variant; файла может ещё не быть."""
+    geometry, options = settings.THUMBNAIL_VARIANTS[variant]
+    source = source_file(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _thumbnail_options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def _lru_get(key):
+    with _lru_lock:
+        thumbnail, expires = _lru.get(key, (None, 0))
+        if thumbnail is None:
+            return None
+        # Миниатюру мог удалить другой воркер: через THUMBNAIL_LRU_TIMEOUT
+        # её наличие снова проверяется по общему KVStore
+        if expires < time.monotonic():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return thumbnail
+
+
+def _lru_set(key, thumbnail):
+    with _lru_lock:
+        _lru[key] = (
+            thumbnail, time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        )
+        _lru.move_to_end(key)
+        while len(_lru) > settings.THUMBNAIL_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _load_raw(keys):
+    """Значения KVStore sorl: одним get_many из кеша, остальные из БД."""
+    kv_cache = caches[thumbnail_settings.THUMBNAIL_CACHE]
+    values = kv_cache.get_many(keys)
+    db_keys = [key for key in keys if key not in values]
+    if db_keys:
+        stored = dict(
+            KVStoreModel.objects.filter(key__in=db_keys)
+            .values_list('key', 'value')
+        )
+        # Как и сам sorl, запоминаем в кеше и отсутствие записи
+        kv_cache.set_many(
+            {key: stored.get(key, EMPTY_VALUE) for key in db_keys},
+            thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(stored)
+    return values
+
+
+def get_ready_thumbnails(images, variants=None):
+    """Готовые миниатюры нескольких картинок за один поход в KVStore.
+
+    Возвращает словарь {(имя картинки, вариант): ImageFile или None}.
+    Найденные миниатюры запоминаются в LRU процесса на
+    THUMBNAIL_LRU_TIMEOUT: файл готовой миниатюры не меняется, но его
+    может удалить очистка медиафайлов в другом воркере.
+    """
+    variants = variants or list(settings.THUMBNAIL_VARIANTS)
+    keys = {}
+    for image in images:
+        if not image:
+            continue
+        for variant in variants:
+            key = add_prefix(thumbnail_file(image, variant).key)
+            keys[key] = (getattr(image, 'name', image), variant)
+    result = dict.fromkeys(keys.values())
+    missing = []
+    for key, item in keys.items():
+        thumbnail = _lru_get(key)
+        if thumbnail is None:
+            missing.append(key)
+        else:
+            result[item] = thumbnail
+    if missing:
+        values = _load_raw(missing)
+        for key in missing:
+            value = values.get(key)
+            if value is None or value == EMPTY_VALUE:
+                continue
+            thumbnail = deserialize_image_file(value)
+            _lru_set(key, thumbnail)
+            result[keys[key]] = thumbnail
+    return result
+
+
+def get_ready_thumbnail(image, variant):
+    """Готовая миниатюра или None, если её ещё нет."""
+    if not image:
+        return None
+    name = getattr(image, 'name', image)
+    return get_ready_thumbnails([image], [variant])[(name, variant)]
+
+
+def prefetch_thumbnails(posts):
+    """Находит миниатюры всех картинок постов одним запросом.
+
+    Результат сохраняется в post.thumbnails ({вариант: ImageFile или
+    None}) и используется тегом post_picture.
+    """
+    images = [post.image for post in posts if post.image]
+    found = get_ready_thumbnails(images)
+    for post in posts:
+        if post.image:
+            post.thumbnails = {
+                variant: found[(post.image.name, variant)]
+                for variant in settings.THUMBNAIL_VARIANTS
+            }
+
+
+def generate_thumbnails(name):
+    """Нарезает все варианты миниатюр картинки с именем name."""
+    try:
+        missing = [
+            variant for variant in settings.THUMBNAIL_VARIANTS
+            if get_ready_thumbnail(name, variant) is None
+        ]
+        for variant in missing:
+            geometry, options = settings.THUMBNAIL_VARIANTS[variant]
+            get_thumbnail(source_file(name), geometry, **options)
+    finally:
+        cache.delete(pending_key(name))
+    if missing:
+        # Карточки с исходной картинкой вместо миниатюры перестают
+        # находиться в кеше, ленты с такими постами сбрасываются разом
+        cache.set(image_version_key(name), uuid.uuid4().hex, None)
+        scopes = {index_scope()}
+        posts = Post.objects.filter(image=name).values_list(
+            'author__username', 'group__slug'
+        )
+        for username, slug in posts:
+            scopes.add(profile_scope(username))
+            if slug:
+                scopes.add(group_scope(slug))
+        bump_feeds(*scopes)
+
+
+def schedule_thumbnails(image):
+    """Ставит нарезку миниатюр в фон после фиксации транзакции.
+
+    Повторные вызовы для той же картинки, пока нарезка не закончилась,
+    ничего не делают.
+    """
+    if not image:
+        return
+    name = getattr(image, 'name', image)
+    if cache.add(pending_key(name), True,
+                 settings.THUMBNAIL_PENDING_TIMEOUT):
+        transaction.on_commit(
+            lambda: run_in_background(generate_thumbnails, name)
+        )
+
+
+def _delete_unreferenced(name):
+    storage = Post._meta.get_field('image').storage
+    # Возраст и ссылки проверяются под блокировкой имени прямо перед
+    # удалением: такая же картинка, загруженная для нового поста, либо
+    # освежит файл до проверки, либо запишет его заново после удаления
+    with storage.lock(name) as locked:
+        if not locked or Post.objects.filter(image=name).exists():
+            return
+        if storage.exists(name) and (
+            storage.age(name) < settings.MEDIA_MIN_AGE
+        ):
+            return
+        for variant in settings.THUMBNAIL_VARIANTS:
+            with _lru_lock:
+                _lru.pop(add_prefix(thumbnail_file(name, variant).key), None)
+        # Удаляет файл, его миниатюры и их записи в KVStore
+        delete(source_file(name))
+
+
+def release_image(name):
+    """Убирает ссылку на картинку: последняя ссылка удаляет файл.
+
+    Ссылки на файл — посты с этой картинкой, поэтому счётчик ссылок
+    не хранится отдельно и не расходится с данными. Проверка идёт после
+    фиксации транзакции, когда удаление или замена картинки уже видны,
+    в фоне: файлов и миниатюр бывает много. Файл моложе MEDIA_MIN_AGE
+    не удаляется — его подберёт collect_media_garbage.
+    """
+    if name:
+        transaction.on_commit(
+            lambda: run_in_background(_delete_unreferenced, name)
+        )
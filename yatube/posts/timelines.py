@@ -0,0 +1,230 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Лента пользователя — ограниченный список записей (created, post_id,
+author_id), отсортированный от новых к старым и хранящийся в кеше.
+Новый пост дописывается в ленты подписчиков автора при сохранении,
+удалённый или переданный другому автору пост из них убирается, подписка
+и отписка дополняют или чистят ленту. Если ленты в кеше нет, она
+собирается из БД одним запросом при первом чтении.
+
+Кеш общий для всех воркеров, поэтому ленты меняются под блокировкой
+в том же кеше: иначе две одновременные раскладки в одну ленту прочитали
+бы её одновременно, и вторая запись затёрла бы пост первой.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.tasks import run_in_background
+from .models import Follow, Post
+
+FANOUT_CHUNK_SIZE = 500
+# Сколько секунд живёт блокировка ленты (на случай упавшего процесса)
+# и сколько ждать чужую блокировку, прежде чем просто сбросить ленту
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1
+LOCK_RETRY_DELAY = 0.01
+
+
+def timeline_key(user_id):
+    return f'timeline:{user_id}'
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def _sorted(entries):
+    # Один пост — одна запись; при повторе остаётся добавленная последней
+    entries = list({entry[1]: entry for entry in entries}.values())
+    entries.sort(key=lambda entry: (entry[0], entry[1]), reverse=True)
+    return entries[:settings.TIMELINE_LENGTH]
+
+
+def _acquire(keys):
+    """Берёт блокировки лент; возвращает (взятые, занятые) ключи."""
+    locked, waiting = [], list(keys)
+    deadline = time.monotonic() + LOCK_WAIT
+    while True:
+        busy = []
+        for key in waiting:
+            if cache.add(lock_key(key), True, LOCK_TIMEOUT):
+                locked.append(key)
+            else:
+                busy.append(key)
+        if not busy or time.monotonic() >= deadline:
+            return locked, busy
+        waiting = busy
+        time.sleep(LOCK_RETRY_DELAY)
+
+
+def _update_timelines(user_ids, update):
+    """Меняет уже собранные ленты пользователей функцией update.
+
+    update получает записи ленты и возвращает новые или None, если ленту
+    проще собрать из БД заново. Ленты, которых нет в кеше, не трогаем:
+    они соберутся при первом чтении. Ленту, чью блокировку не удалось
+    взять за LOCK_WAIT, удаляем по той же причине.
+    """
+    for start in range(0, len(user_ids), FANOUT_CHUNK_SIZE):
+        chunk = [
+            timeline_key(user_id)
+            for user_id in user_ids[start:start + FANOUT_CHUNK_SIZE]
+        ]
+        # Ленту, которую сейчас собирают из БД (её блокировка занята),
+        # тоже ждём: сборка могла прочитать БД до нашего изменения
+        found = cache.get_many(chunk + [lock_key(key) for key in chunk])
+        keys = [
+            key for key in chunk if key in found or lock_key(key) in found
+        ]
+        if not keys:
+            continue
+        locked, busy = _acquire(keys)
+        try:
+            # Перечитываем под блокировкой: ленту могли поменять
+            changed, dropped = {}, busy
+            for key, entries in cache.get_many(locked).items():
+                entries = update(entries)
+                if entries is None:
+                    dropped.append(key)
+                else:
+                    changed[key] = entries
+            if changed:
+                cache.set_many(changed, settings.TIMELINE_TIMEOUT)
+            if dropped:
+                cache.delete_many(dropped)
+        finally:
+            if locked:
+                cache.delete_many([lock_key(key) for key in locked])
+
+
+def rebuild_timeline(user_id):
+    key = timeline_key(user_id)
+    # Сборка идёт под блокировкой ленты: раскладка, заставшая её,
+    # дождётся записи и допишет пост, а не пропустит несобранную ленту.
+    # Без блокировки лента отдаётся, но в кеш не пишется.
+    locked, _ = _acquire([key])
+    try:
+        entries = list(
+            Post.objects.filter(author__following__user_id=user_id)
+            .order_by('-created', '-pk')
+            .values_list('created', 'pk', 'author_id')
+            [:settings.TIMELINE_LENGTH]
+        )
+        if locked:
+            cache.set(key, entries, settings.TIMELINE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key(key))
+    return entries
+
+
+def get_timeline(user_id):
+    """Возвращает id постов ленты подписок от новых к старым."""
+    entries = cache.get(timeline_key(user_id))
+    if entries is None:
+        entries = rebuild_timeline(user_id)
+    return [post_id for _, post_id, _ in entries]
+
+
+def _follower_ids(author_id):
+    return Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+
+
+def _for_followers(author_id, task, *args):
+    """Выполняет task(*args, follower_ids) для подписчиков автора.
+
+    Авторов с большим числом подписчиков обрабатываем в фоне, чтобы
+    не задерживать ответ; задача сама перечитает список подписчиков.
+    """
+    limit = settings.TIMELINE_FANOUT_SYNC_LIMIT
+    follower_ids = list(_follower_ids(author_id)[:limit + 1])
+    if len(follower_ids) > limit:
+        run_in_background(task, *args)
+    else:
+        task(*args, follower_ids)
+
+
+def _fan_out_post(post_id, created, author_id, follower_ids=None):
+    if follower_ids is None:
+        follower_ids = list(_follower_ids(author_id))
+    entry = (created, post_id, author_id)
+    _update_timelines(follower_ids, lambda entries: _sorted(entries + [entry]))
+
+
+def _remove_post(post_id, author_id, follower_ids=None):
+    if follower_ids is None:
+        follower_ids = list(_follower_ids(author_id))
+    # Сверяем и автора: если пост передан другому автору, в ленте общего
+    # подписчика может уже лежать новая запись о нём.
+    # Обрезанная лента после этого короче на один пост, а не пересобирается:
+    # в её хвосте недостаёт лишь самого старого поста.
+    _update_timelines(follower_ids, lambda entries: [
+        entry for entry in entries
+        if (entry[1], entry[2]) != (post_id, author_id)
+    ])
+
+
+def push_post(post):
+    """Дописывает новый пост в ленты подписчиков автора.
+
+    Раскладка идёт после фиксации транзакции: лента, собранная из БД
+    раньше, поста ещё не увидела бы.
+    """
+    post_id, created, author_id = post.pk, post.created, post.author_id
+    transaction.on_commit(lambda: _for_followers(
+        author_id, _fan_out_post, post_id, created, author_id
+    ))
+
+
+def remove_post(post_id, author_id):
+    """Убирает пост из лент подписчиков автора после фиксации транзакции.
+
+    Нужно после удаления поста и после смены его автора: иначе пост
+    оставался бы в лентах до истечения TIMELINE_TIMEOUT.
+    """
+    transaction.on_commit(
+        lambda: _for_followers(author_id, _remove_post, post_id, author_id)
+    )
+
+
+def add_author(user_id, author_id):
+    """Дополняет ленту постами автора после подписки."""
+    if not cache.has_key(timeline_key(user_id)):
+        return
+    backfill = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-created', '-pk')
+        .values_list('created', 'pk', 'author_id')[:settings.TIMELINE_LENGTH]
+    )
+    _update_timelines([user_id], lambda entries: _sorted(entries + backfill))
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    def update(entries):
+        if len(entries) >= settings.TIMELINE_LENGTH:
+            # Лента была обрезана: после удаления постов её хвост
+            # нужно дочитать из БД, проще собрать заново.
+            return None
+        return [entry for entry in entries if entry[2] != author_id]
+
+    _update_timelines([user_id], update)
+
+
+def drop_followers_timelines(author_ids):
+    """Удаляет из кеша ленты подписчиков авторов.
+
+    Нужно после массовых вставок в обход сигналов (bulk_create):
+    ленты соберутся из БД при следующем чтении.
+    """
+    follower_ids = Follow.objects.filter(
+        author_id__in=author_ids
+    ).values_list('user_id', flat=True).distinct()
+    keys = [timeline_key(user_id) for user_id in follower_ids.iterator()]
+    for start in range(0, len(keys), FANOUT_CHUNK_SIZE):
+        cache.delete_many(keys[start:start + FANOUT_CHUNK_SIZE])
@@ -1,8 +1,238 @@
-from django.core.paginator import Paginator
+import base64
+import json
+
 from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+
+
+def feed_count_key(kind, pk=None):
+    return f'feed_count:{kind}' if pk is None else f'feed_count:{kind}:{pk}'
+
+
+def estimate_count(queryset):
+    """Оценка размера выборки для очень больших лент.
+
+    До PAGINATOR_ESTIMATE_THRESHOLD строк считаем точно (COUNT по LIMIT),
+    дальше оцениваем по диапазону первичных ключей — это два поиска
+    по индексу вместо прохода по всей таблице.
+    """
+    threshold = settings.PAGINATOR_ESTIMATE_THRESHOLD
+    queryset = queryset.order_by()
+    count = queryset[:threshold].count()
+    if count < threshold:
+        return count
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    return max(threshold, bounds['high'] - bounds['low'] + 1)
+
+
+def get_feed_count(queryset, count_key=None):
+    """Количество постов ленты из кеша.
+
+    Кеш сбрасывается сигналами при создании и удалении постов,
+    а PAGINATOR_COUNT_TIMEOUT ограничивает устаревание значения сверху.
+    """
+    count = cache.get(count_key) if count_key else None
+    if count is None:
+        if settings.PAGINATOR_COUNT_MODE == 'estimated':
+            count = estimate_count(queryset)
+        else:
+            count = queryset.count()
+        if count_key:
+            cache.set(count_key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который не выполняет COUNT(*) на каждый запрос."""
+
+    # Сигнатура Paginator сохраняется: ModelAdmin.get_paginator передаёт
+    # orphans и allow_empty_first_page позиционно
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, *, count_key=None, count=None):
+        super().__init__(
+            object_list, per_page, orphans, allow_empty_first_page
+        )
+        self.count_key = count_key
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        # Готовое значение, например денормализованный счётчик
+        if self.known_count is not None:
+            return self.known_count
+        if isinstance(self.object_list, list):
+            return len(self.object_list)
+        return get_feed_count(self.object_list, self.count_key)
+
+
+class CursorPage:
+    """Страница курсорной паджинации: без общего количества и номеров."""
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class BaseCursorPaginator:
+    """Общая часть курсорной паджинации: курсоры и сборка страницы.
+
+    Курсор — значения ключа сортировки последней (или первой) строки
+    страницы в base64 от JSON. Наследник задаёт ключ (cursor_values,
+    parse_cursor) и выборку строк после курсора (_fetch).
+    """
+    is_cursor = True
+
+    def cursor_values(self, obj):
+        raise NotImplementedError
+
+    def parse_cursor(self, values):
+        """Значения ключа из JSON; ошибка означает битый курсор."""
+        raise NotImplementedError
+
+    def _fetch(self, values, forward):
+        """До per_page + 1 строк после курсора values в направлении
+        forward; назад — в обратном порядке. values может быть None."""
+        raise NotImplementedError
+
+    def _objects(self, rows):
+        return rows
+
+    def encode_cursor(self, obj):
+        values = self.cursor_values(obj)
+        # isoformat() сохраняет микросекунды, в отличие от DjangoJSONEncoder
+        raw = json.dumps(values, default=lambda value: value.isoformat())
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает значения полей курсора или None для битого курсора."""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            return self.parse_cursor(json.loads(raw.decode()))
+        except Exception:
+            return None
+
+    def get_page(self, after=None, before=None):
+        after_values = self.decode_cursor(after)
+        before_values = None if after_values else self.decode_cursor(before)
+        if before_values:
+            rows = self._fetch(before_values, forward=False)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = bool(rows)
+        else:
+            rows = self._fetch(after_values, forward=True)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after_values) and bool(rows)
+        object_list = self._objects(rows)
+        return CursorPage(
+            object_list,
+            self,
+            next_cursor=(
+                self.encode_cursor(object_list[-1])
+                if has_next and object_list else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(object_list[0])
+                if has_previous and object_list else None
+            ),
+        )
+
+
+class CursorPaginator(BaseCursorPaginator):
+    """Keyset-паджинация по паре полей, например (created, pk).
+
+    Вместо OFFSET страница выбирается условием «строго после/до курсора»,
+    поэтому любая страница стоит столько же, сколько первая,
+    а COUNT(*) не выполняется вовсе.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-created', '-pk')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.descending = ordering[0].startswith('-')
+
+    def cursor_values(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def parse_cursor(self, values):
+        if len(values) != len(self.fields):
+            raise ValueError('Неверное число полей курсора')
+        model = self.object_list.model
+        return [
+            model._meta.get_field(
+                'id' if field == 'pk' else field
+            ).to_python(value)
+            for field, value in zip(self.fields, values)
+        ]
+
+    def _seek(self, queryset, values, forward):
+        # Направление сравнения зависит и от сортировки, и от того,
+        # листаем ли мы вперёд или назад.
+        lookup = 'lt' if self.descending == forward else 'gt'
+        first, second = self.fields
+        return queryset.filter(
+            Q(**{f'{first}__{lookup}': values[0]})
+            | Q(**{first: values[0], f'{second}__{lookup}': values[1]})
+        )
+
+    def _fetch(self, values, forward):
+        ordering = self.ordering
+        if not forward:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        queryset = self.object_list.order_by(*ordering)
+        if values:
+            queryset = self._seek(queryset, values, forward)
+        return list(queryset[:self.per_page + 1])
 
 
-def paginate_page(request, posts):
-    paginator = Paginator(posts, settings.COUNT_POSTS)
+def paginate_page(request, posts, cursor=None, count_key=None, count=None):
+    # Курсорный режим включается настройкой CURSOR_PAGINATION
+    # или явно из view через аргумент cursor
+    if cursor is None:
+        cursor = settings.CURSOR_PAGINATION
+    if cursor:
+        paginator = CursorPaginator(posts, settings.COUNT_POSTS)
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    paginator = CachedCountPaginator(
+        posts, settings.COUNT_POSTS, count_key=count_key, count=count
+    )
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
@@ -1,20 +1,34 @@
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Follow, Post, Group
+from .models import Comment, Follow, Post, Group
 from django.contrib.auth import get_user_model
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from .forms import PostForm, CommentForm
-from .utils import paginate_page
-from django.views.decorators.cache import cache_page
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from .forms import ExportForm, PostForm, CommentForm
+from .export import CONTENT_TYPES, EXPORTS, export_lines
+from .utils import CursorPaginator, feed_count_key, paginate_page
+from .counters import get_author_stats
+from .timelines import get_timeline
+from .recommendations import recommend_authors
+from .thumbnails import schedule_thumbnails
+from .search import SearchPaginator
+from django.conf import settings
+from .caching import cache_feed, group_scope, index_scope, profile_scope
+from .conditional import feed_condition, post_condition
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+@feed_condition(index_scope, 'html', per_user=True)
+@cache_feed(settings.INDEX_CACHE_TIMEOUT, index_scope)
 def index(request):
     # Одна строка вместо тысячи слов на SQL:
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author', 'group')
     # В файле utils.py создал функцию paginate_page для паджинации
-    page_obj = paginate_page(request, posts)
+    page_obj = paginate_page(
+        request, posts, count_key=feed_count_key('index')
+    )
     # В словаре context отправляем
     # информацию в шаблон
     context = {
@@ -23,11 +37,15 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@feed_condition(group_scope, 'html', per_user=True)
+@cache_feed(settings.FEED_CACHE_TIMEOUT, group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    posts = Post.objects.select_related('author', 'group').filter(
+        group=group)
     # В файле utils.py создал функцию paginate_page для паджинации
-    page_obj = paginate_page(request, posts)
+    # Количество постов берём из денормализованного счётчика группы
+    page_obj = paginate_page(request, posts, count=group.posts_count)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -35,39 +53,71 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@feed_condition(profile_scope, 'html', per_user=True)
+@cache_feed(settings.FEED_CACHE_TIMEOUT, profile_scope)
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts = Post.objects.select_related('author').filter(
-        author__username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = Post.objects.select_related('author', 'group').filter(
+        author=author)
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user,
-        author__username=username
+        author=author
     ).exists()
+    stats = get_author_stats(author)
     # В файле utils.py создал функцию paginate_page для паджинации
-    page_obj = paginate_page(request, posts)
+    page_obj = paginate_page(request, posts, count=stats.posts_count)
     context = {
         'page_obj': page_obj,
         'author': author,
         'following': following,
+        'stats': stats,
     }
     return render(request, template, context)
 
 
+@post_condition('html', per_user=True)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm()
     context = {
         'post': post,
-        'comments': comments,
-        'form': form
+        'comments': get_comments_page(request, post.pk),
+        'form': form,
+        'author_stats': get_author_stats(post.author),
     }
     return render(request, template, context)
 
 
+def get_comments_page(request, post_id):
+    # Комментарии листаются курсором от старых к новым,
+    # авторы подгружаются тем же запросом
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        ordering=('created', 'pk'),
+    )
+    return paginator.get_page(after=request.GET.get('after'))
+
+
+@post_condition('comments')
+def post_comments(request, post_id):
+    # Следующая страница комментариев HTML-фрагментом для «Показать ещё»
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(request, post.pk),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'POST':
@@ -75,11 +125,13 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            schedule_thumbnails(post.image)
             return redirect('posts:profile', username=str(request.user))
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = PostForm(
@@ -91,7 +143,8 @@ def post_edit(request, post_id):
         return redirect('posts:post_detail', post_id)
     if request.method == 'POST':
         if form.is_valid():
-            form.save()
+            post = form.save()
+            schedule_thumbnails(post.image)
             return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -102,6 +155,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -115,17 +169,68 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
+    # Лента подписок читается из заранее собранного списка id,
+    # из БД достаём только посты текущей страницы
+    post_ids = get_timeline(request.user.pk)
+    page_obj = paginate_page(request, post_ids, cursor=False)
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list
     )
-    page_obj = paginate_page(request, posts)
+    page_obj.object_list = [
+        posts[post_id] for post_id in page_obj.object_list
+        if post_id in posts
+    ]
+    # Кандидаты считаются по графу подписок в памяти процесса,
+    # из БД достаём только их профили
+    author_ids = recommend_authors(request.user.pk)
+    authors = User.objects.select_related('stats').in_bulk(author_ids)
     context = {
         'page_obj': page_obj,
+        'recommended_authors': [
+            authors[pk] for pk in author_ids if pk in authors
+        ],
     }
     return render(request, 'posts/follow.html', context)
 
 
+def search(request):
+    # Поиск идёт по индексу FTS5, а не LIKE по всей таблице постов
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, settings.COUNT_POSTS)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@staff_member_required
+def export(request, kind):
+    # Выгрузка идёт потоком: строки читаются из БД пачками
+    # и сразу отдаются клиенту
+    if kind not in EXPORTS:
+        raise Http404
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    filters = form.cleaned_data
+    export_format = filters.pop('format') or 'ndjson'
+    response = StreamingHttpResponse(
+        export_lines(kind, export_format, **filters),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{export_format}"'
+    )
+    return response
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -136,6 +241,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     is_follower = Follow.objects.filter(user=request.user, author=author)
@@ -0,0 +1,24 @@
+// Кнопка «Показать ещё» подгружает следующую страницу комментариев
+// HTML-фрагментом и встаёт на её место. Без JS ссылка просто открывает
+// страницу поста с этой страницей комментариев.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-comments-more]');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  fetch(link.dataset.url, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      link.insertAdjacentHTML('afterend', html);
+      link.remove();
+    })
+    .catch(function () {
+      window.location = link.href;
+    });
+});
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -132,9 +133,19 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# collectstatic складывает сюда файлы с хешем в имени, манифест
+# и gzip-копии (core.storage), их отдаёт core.views.static_file
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+# Сколько секунд браузер хранит файл статики с хешем в имени
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
 # Добавляем константу количества отображаемых постов в переменное окружение
 COUNT_POSTS = os.environ.get('COUNT_POSTS', 10)
 
+# Курсорная паджинация лент (?after=/?before= вместо ?page=)
+CURSOR_PAGINATION = os.environ.get('CURSOR_PAGINATION', 'False') == 'True'
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -149,13 +160,100 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Контрольная точка сборки мусора в медиафайлах (collect_media_garbage)
+MEDIA_GC_CHECKPOINT = os.path.join(BASE_DIR, 'media_gc.json')
+# Файлы моложе стольких секунд очистка не удаляет: их могли только что
+# загрузить (или загрузить повторно) для ещё не сохранённого поста
+MEDIA_MIN_AGE = 60 * 60
 
+# Общий для всех воркеров кеш в файле SQLite (core.cache_backends)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_SIZE': int(os.environ.get('CACHE_MAX_SIZE', 256 * 2 ** 20)),
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Материализованные ленты подписок: длина ленты, время жизни в кеше
+# и число подписчиков, до которого раскладка идёт прямо в запросе
+TIMELINE_LENGTH = 1000
+TIMELINE_TIMEOUT = 60 * 60 * 24
+TIMELINE_FANOUT_SYNC_LIMIT = 1000
+
+# Счётчики постов в лентах: сколько секунд значение может устаревать
+# и режим подсчёта ('exact' или 'estimated' для очень больших лент)
+PAGINATOR_COUNT_TIMEOUT = 60
+PAGINATOR_COUNT_MODE = os.environ.get('PAGINATOR_COUNT_MODE', 'exact')
+PAGINATOR_ESTIMATE_THRESHOLD = 10000
+
+# Время жизни закешированных страниц лент. Страницы сбрасываются
+# сигналами при изменении данных, поэтому TTL может быть большим
+INDEX_CACHE_TIMEOUT = 60 * 60
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Время жизни отрисованных карточек постов в кеше
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+# Варианты миниатюр картинок постов: имя -> (геометрия, опции sorl).
+# Нарезаются заранее, в фоне после сохранения поста (posts.thumbnails)
+THUMBNAIL_VARIANTS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_480': ('480x170', {'crop': 'center', 'upscale': True}),
+    'card_webp': (
+        '960x339', {'crop': 'center', 'upscale': True, 'format': 'WEBP'}
+    ),
+    'card_480_webp': (
+        '480x170', {'crop': 'center', 'upscale': True, 'format': 'WEBP'}
+    ),
+}
+# Адаптивные картинки <picture>: из каких вариантов собирать srcset
+# для браузеров с WebP и для остальных (fallback) и какой sizes отдавать
+THUMBNAIL_PICTURES = {
+    'card': {
+        'webp': ('card_480_webp', 'card_webp'),
+        'fallback': ('card_480', 'card'),
+        'sizes': '(max-width: 992px) 100vw, 960px',
+    },
+}
+# Сколько секунд считать нарезку картинки запущенной и не ставить повторно
+THUMBNAIL_PENDING_TIMEOUT = 10 * 60
+# Сколько найденных миниатюр помнить в памяти процесса
+THUMBNAIL_LRU_SIZE = 1024
+# и сколько секунд: удаление миниатюры другим воркером процесс не видит
+THUMBNAIL_LRU_TIMEOUT = 60
+
+# Сколько комментариев показывать на странице поста за раз
+COMMENTS_PER_PAGE = 20
+# Сколько последних комментариев показывать под постом в лентах
+FEED_COMMENT_PREVIEWS = 3
+
+# Рекомендации «Кого почитать» (posts.recommendations): сколько авторов
+# показывать, раз в сколько секунд перестраивать граф подписок в памяти
+# и после скольких подписок и отписок в процессе перестраивать его раньше
+RECOMMENDATIONS_COUNT = 5
+FOLLOW_GRAPH_TIMEOUT = 10 * 60
+FOLLOW_GRAPH_MAX_CHANGES = 10000
+# Сколько читателей каждого автора учитывать в совместных подписках
+RECOMMENDATIONS_FOLLOWERS_SAMPLE = 200
+
+# Сколько строк читать из БД за раз при выгрузке (posts.export)
+EXPORT_CHUNK_SIZE = 2000
+
+# Пул потоков для фоновых задач (core.tasks)
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 4))
+BACKGROUND_TASKS_EAGER = (
+    os.environ.get('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+)
+# Ошибка задачи, выполненной сразу, выбрасывается, а не пишется в лог.
+# Оба флага для тестов включаются в yatube.settings_test
+BACKGROUND_TASKS_RAISE = False
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 INTERNAL_IPS = [
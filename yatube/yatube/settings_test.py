@@ -0,0 +1,19 @@
+"""Настройки для тестов (manage.py test)."""
+from .settings import *  # noqa: F401,F403
+
+# Тесты не должны видеть кеш запущенного сервера и прошлых прогонов.
+# Кеш в памяти процесса живёт ровно один прогон и не оставляет файлов
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube-tests',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# Задачи выполняются сразу: потоки пула писали бы в тестовую БД
+# одновременно с её очисткой между тестами. Ошибка задачи роняет тест
+BACKGROUND_TASKS_EAGER = True
+BACKGROUND_TASKS_RAISE = True
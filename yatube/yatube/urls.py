@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 # from django.conf.urls.static import static
+from core.views import static_file
 
 urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
@@ -10,6 +11,7 @@ urlpatterns = [
     path('group/<slug:slug>/', include('posts.urls', namespace='posts')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path(settings.STATIC_URL.lstrip('/') + '<path:path>', static_file),
 ]
 
 if settings.DEBUG: